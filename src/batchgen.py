@@ -0,0 +1,247 @@
+import numpy as np
+
+from bitboard import KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, ROOK_DIRS, BISHOP_DIRS, BEYOND
+from encoding import (encode, SIDE_PLANE, CASTLING_PLANE, EN_PASSANT_PLANE,
+                      POLICY_SIZE, UNDER_PROMOTIONS)
+
+# Move generation for a whole batch of positions at once. Positions come
+# in as the planes of encoding.encode, every step below is a NumPy
+# operation over the batch (and over the 64 squares), so the number of
+# interpreted calls does not grow with the batch size.
+
+NONE = 64  # padding square, its bit is empty
+
+BIT = np.array([1 << sq for sq in range(64)] + [0], dtype=np.uint64)
+SQUARES = np.arange(64)
+KNIGHT = np.array(KNIGHT_ATTACKS + [0], dtype=np.uint64)
+KING = np.array(KING_ATTACKS + [0], dtype=np.uint64)
+# PAWN_HITS[color][sq]: squares a pawn of color on sq attacks (white 0, black 1)
+PAWN_HITS = np.array([PAWN_ATTACKS[0] + [0], PAWN_ATTACKS[1] + [0]], dtype=np.uint64)
+
+
+def _ray_table(dirs):
+    # RAYS[d, sq]: squares beyond sq in direction d, nothing for the padding square
+    return np.array([BEYOND[direction] + [0] for direction in dirs], dtype=np.uint64)
+
+
+ORTHOGONAL = _ray_table(ROOK_DIRS)
+DIAGONAL = _ray_table(BISHOP_DIRS)
+# rays that grow the square index stop at their lowest blocker, the others at the highest
+ORTHOGONAL_UP = [dr * 8 + dc > 0 for dr, dc in ROOK_DIRS]
+DIAGONAL_UP = [dr * 8 + dc > 0 for dr, dc in BISHOP_DIRS]
+
+
+def _pawn_tables():
+    push = np.zeros((2, 65), dtype=np.uint64)
+    double = np.zeros((2, 65), dtype=np.uint64)
+    for color, step, start in ((0, -8, 6), (1, 8, 1)):
+        for sq in range(8, 56):
+            push[color, sq] = 1 << (sq + step)
+            if sq // 8 == start:
+                double[color, sq] = 1 << (sq + 2 * step)
+    return push, double
+
+
+PAWN_PUSH, PAWN_DOUBLE = _pawn_tables()
+
+# LINES[sq]: every square a queen on an empty board reaches from sq
+LINES = np.bitwise_or.reduce(np.concatenate([ORTHOGONAL, DIAGONAL]), axis=0)
+
+# castling: (plane, side, king from, king to, rook from, rook to, empty squares)
+CASTLES = [
+    (0, 0, 60, 62, 63, 61, [61, 62]),
+    (1, 0, 60, 58, 56, 59, [57, 58, 59]),
+    (2, 1, 4, 6, 7, 5, [5, 6]),
+    (3, 1, 4, 2, 0, 3, [1, 2, 3]),
+]
+
+
+class Batch:
+    '''
+    Bitboards of a batch of positions from encoding planes, split into the
+    side to move (us) and the other side (them)
+    '''
+
+    def __init__(self, planes):
+        n = len(planes)
+        bits = planes[:, :12].reshape(n, 12, 64) != 0
+        words = np.packbits(bits, axis=-1, bitorder='little').view('<u8').reshape(n, 12)
+        self.n = n
+        self.white = planes[:, SIDE_PLANE, 0, 0] != 0
+        side = self.white[:, None]
+        self.us = np.where(side, words[:, :6], words[:, 6:])
+        self.them = np.where(side, words[:, 6:], words[:, :6])
+        self.own = np.bitwise_or.reduce(self.us, axis=1)
+        self.enemy = np.bitwise_or.reduce(self.them, axis=1)
+        self.occupied = self.own | self.enemy
+        self.castling = planes[:, CASTLING_PLANE:CASTLING_PLANE + 4, 0, 0] != 0
+        ep = planes[:, EN_PASSANT_PLANE].reshape(n, 64) != 0
+        self.ep = np.where(ep.any(axis=1), ep.argmax(axis=1), NONE)
+        self.color = np.where(self.white, 0, 1)
+        # piece type on every square for the side to move, -1 when none of ours
+        has = (self.us[:, :, None] & BIT[None, None, :64]) != 0
+        self.kinds = np.where(has.any(axis=1), has.argmax(axis=1), -1)
+        self.king = _lowest(self.us[:, 5])
+
+
+def _lowest(words):
+    # index of the lowest set bit, NONE for empty words
+    low = words & (~words + np.uint64(1))
+    return _index(low)
+
+
+def _highest(words):
+    # index of the highest set bit, NONE for empty words. The float log
+    # may round up to the next power, step back when it did
+    top = np.minimum(np.log2(np.maximum(words, 1).astype(np.float64)).astype(np.int64), 63)
+    top -= BIT[top] > words
+    return np.where(words != 0, top, NONE)
+
+
+def _index(bits):
+    # index of single bit words (exact in float64)
+    return np.where(bits != 0, np.log2(np.maximum(bits, 1).astype(np.float64)).astype(np.int64), NONE)
+
+
+def _slides(rays, up, sources, occupied):
+    '''
+    Slider targets of the squares in sources (...) along rays, every ray
+    is cut behind its first blocker (which is included)
+    '''
+    targets = np.zeros(sources.shape, dtype=np.uint64)
+    for d in range(len(rays)):
+        ray = rays[d][sources]
+        blockers = ray & occupied
+        first = _lowest(blockers) if up[d] else _highest(blockers)
+        targets |= ray ^ rays[d][first]
+    return targets
+
+
+def attacked(sq, occupied, them, color):
+    '''
+    Is sq attacked by the pieces them (..., 6) of the side not to move.
+    color is the side to move (0 white, 1 black), all arrays line up
+    '''
+    hits = KNIGHT[sq] & them[..., 1]
+    hits |= KING[sq] & them[..., 5]
+    hits |= PAWN_HITS[color, sq] & them[..., 0]
+    hits |= _slides(ORTHOGONAL, ORTHOGONAL_UP, sq, occupied) & (them[..., 3] | them[..., 4])
+    hits |= _slides(DIAGONAL, DIAGONAL_UP, sq, occupied) & (them[..., 2] | them[..., 4])
+    return hits != 0
+
+
+def _targets(batch):
+    '''
+    (N, 64) pseudo legal target bitboards of the piece on every square
+    '''
+    kinds = batch.kinds
+    occupied = batch.occupied[:, None]
+    squares = np.broadcast_to(SQUARES, kinds.shape)
+    zero = np.uint64(0)
+
+    targets = np.where(kinds == 1, KNIGHT[squares], zero)
+    targets |= np.where(kinds == 5, KING[squares], zero)
+    # sliders are few, only their squares walk the rays
+    for rays, up, movers in ((ORTHOGONAL, ORTHOGONAL_UP, (kinds == 3) | (kinds == 4)),
+                             (DIAGONAL, DIAGONAL_UP, (kinds == 2) | (kinds == 4))):
+        n, sq = np.nonzero(movers)
+        targets[n, sq] |= _slides(rays, up, sq, batch.occupied[n])
+
+    # pawns: pushes onto empty squares, captures onto enemies or the en passant square
+    color = batch.color[:, None]
+    push = PAWN_PUSH[color, squares] & ~occupied
+    double = np.where(push != 0, PAWN_DOUBLE[color, squares] & ~occupied, zero)
+    captures = PAWN_HITS[color, squares] & (batch.enemy[:, None] | BIT[batch.ep][:, None])
+    targets |= np.where(kinds == 0, push | double | captures, zero)
+    targets &= ~batch.own[:, None]
+
+    # castling, rights imply king and rook on their squares
+    for plane, side, king_from, king_to, rook_from, rook_to, empty in CASTLES:
+        between = np.uint64(sum(1 << sq for sq in empty))
+        ok = batch.castling[:, plane] & (batch.color == side) & (batch.occupied & between == 0)
+        targets[:, king_from] |= np.where(ok, BIT[king_to], zero)
+    return targets
+
+
+def _policy(batch, n, initial, final, keep):
+    '''
+    (N, POLICY_SIZE) mask with the moves initial -> final of position n
+    that pass keep, pawns reaching the last rank get every promotion
+    '''
+    masks = np.zeros((batch.n, POLICY_SIZE), dtype=bool)
+    n, initial, final = n[keep], initial[keep], final[keep]
+    masks[n, initial * 64 + final] = True
+    promotes = (batch.kinds[n, initial] == 0) & ((final < 8) | (final >= 56))
+    n, initial, final = n[promotes], initial[promotes], final[promotes]
+    side = np.where(final < 8, 0, 1)
+    base = 64 * 64 + ((side * 8 + initial % 8) * 3 + final % 8 - initial % 8 + 1) * len(UNDER_PROMOTIONS)
+    for piece in range(len(UNDER_PROMOTIONS)):
+        masks[n, base + piece] = True
+    return masks
+
+
+def _candidates(batch):
+    '''
+    Position, from and to square of every pseudo legal move
+    '''
+    targets = _targets(batch)
+    n, initial = np.nonzero(targets)
+    bits = np.unpackbits(targets[n, initial].view(np.uint8).reshape(-1, 8), axis=-1, bitorder='little')
+    move, final = np.nonzero(bits)
+    return n[move], initial[move], final
+
+
+def pseudo_legal_masks(planes):
+    '''
+    (N, POLICY_SIZE) masks of the pseudo legal moves of a batch of
+    encoding planes: moves by the piece rules, own king safety ignored
+    '''
+    batch = Batch(planes)
+    n, initial, final = _candidates(batch)
+    return _policy(batch, n, initial, final, np.ones(len(n), dtype=bool))
+
+
+def legal_masks(planes):
+    '''
+    (N, POLICY_SIZE) masks of the legal moves of a batch of encoding
+    planes. Every candidate move is played on its bitboards and the own
+    king tested for attacks, all candidates of the batch in one go
+    '''
+    batch = Batch(planes)
+    n, initial, final = _candidates(batch)
+    kinds = batch.kinds[n, initial]
+    color = batch.color[n]
+
+    # the captured piece, en passant takes the pawn beside the target
+    en_passant = (kinds == 0) & (final == batch.ep[n]) & (initial % 8 != final % 8)
+    victim = np.where(en_passant, initial // 8 * 8 + final % 8, final)
+    them = batch.them[n] & ~BIT[victim][:, None]
+
+    occupied = (batch.occupied[n] & ~BIT[initial] & ~BIT[victim]) | BIT[final]
+    castle = (kinds == 5) & (np.abs(final - initial) == 2)
+    rook_from = np.where(castle, np.where(final > initial, initial + 3, initial - 4), NONE)
+    rook_to = np.where(castle, (initial + final) // 2, NONE)
+    occupied = np.where(castle, (occupied & ~BIT[rook_from]) | BIT[rook_to], occupied)
+
+    # only king moves, en passant, moves out of check and moves of pieces
+    # on a line with the king can expose it
+    in_check = attacked(batch.king, batch.occupied, batch.them, batch.color)
+    suspect = ((kinds == 5) | en_passant | in_check[n]
+               | (BIT[initial] & LINES[batch.king[n]] != 0))
+    king = np.where(kinds == 5, final, batch.king[n])
+    keep = np.ones(len(n), dtype=bool)
+    keep[suspect] = ~attacked(king[suspect], occupied[suspect], them[suspect], color[suspect])
+
+    # no castling out of or through check
+    if castle.any():
+        before = batch.occupied[n]
+        through = attacked(initial, before, batch.them[n], color) | attacked(rook_to, before, batch.them[n], color)
+        keep &= ~(castle & through)
+    return _policy(batch, n, initial, final, keep)
+
+
+def legal_move_masks(boards):
+    '''
+    legal_masks of a list of boards
+    '''
+    return legal_masks(encode(boards, dtype=np.uint8))
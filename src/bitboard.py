@@ -0,0 +1,297 @@
+from const import *
+from square import Square
+from piece import *
+from move import Move
+from board import Board, ALL_SQUARES
+
+# square index = row * 8 + col, so bit 0 is a8 and bit 63 is h1
+
+WHITE, BLACK = 0, 1
+COLOR_INDEX = {'white': WHITE, 'black': BLACK}
+
+# piece type index inside a color's bitboards
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+TYPE_INDEX = {Pawn: PAWN, Knight: KNIGHT, Bishop: BISHOP, Rook: ROOK, Queen: QUEEN, King: KING}
+
+# sliding directions, the first four grow the square index
+ROOK_DIRS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+BISHOP_DIRS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+
+def _targets(row, col, offsets):
+    mask = 0
+    for row_incr, col_incr in offsets:
+        r, c = row + row_incr, col + col_incr
+        if Square.inrange(r, c):
+            mask |= 1 << (r * 8 + c)
+    return mask
+
+
+def _ray(row, col, row_incr, col_incr):
+    mask = 0
+    r, c = row + row_incr, col + col_incr
+    while Square.inrange(r, c):
+        mask |= 1 << (r * 8 + c)
+        r, c = r + row_incr, c + col_incr
+    return mask
+
+
+KNIGHT_ATTACKS = [
+    _targets(sq // 8, sq % 8, [(-2, 1), (-1, 2), (1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1)])
+    for sq in range(64)
+]
+KING_ATTACKS = [
+    _targets(sq // 8, sq % 8, [(-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1)])
+    for sq in range(64)
+]
+# squares a pawn of the given color attacks from a square
+PAWN_ATTACKS = [
+    [_targets(sq // 8, sq % 8, [(-1, -1), (-1, 1)]) for sq in range(64)],
+    [_targets(sq // 8, sq % 8, [(1, -1), (1, 1)]) for sq in range(64)],
+]
+# ray from every square in each direction, used to cut a ray behind a blocker
+BEYOND = {
+    (dr, dc): [_ray(sq // 8, sq % 8, dr, dc) for sq in range(64)]
+    for dr, dc in ROOK_DIRS + BISHOP_DIRS
+}
+# (positive, ray, beyond) per square and direction, positive rays grow the index
+ROOK_RAYS = [[(dr * 8 + dc > 0, BEYOND[dr, dc][sq], BEYOND[dr, dc]) for dr, dc in ROOK_DIRS] for sq in range(64)]
+BISHOP_RAYS = [[(dr * 8 + dc > 0, BEYOND[dr, dc][sq], BEYOND[dr, dc]) for dr, dc in BISHOP_DIRS] for sq in range(64)]
+ROOK_MASKS = [sum(ray for _, ray, _ in rays) for rays in ROOK_RAYS]
+BISHOP_MASKS = [sum(ray for _, ray, _ in rays) for rays in BISHOP_RAYS]
+
+
+def slide(rays, occupied):
+    '''
+    Sliding attacks along precomputed rays, each ray is cut behind its
+    first blocker
+    '''
+    attacks = 0
+    for positive, ray, beyond in rays:
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= beyond[first]
+        attacks |= ray
+    return attacks
+
+
+def bishop_attacks(sq, occupied):
+    return slide(BISHOP_RAYS[sq], occupied)
+
+
+def rook_attacks(sq, occupied):
+    return slide(ROOK_RAYS[sq], occupied)
+
+
+class BitBoard(Board):
+    '''
+    Board backend that mirrors the position in twelve bitboards
+    (pieces[color][type]) plus occupancy masks and generates moves
+    with bitboard attacks instead of walking the Square grid.
+    The Square grid is still kept for the GUI.
+    '''
+    # attack queries are answered from the bitboards
+    track_attacks = False
+
+    def _sync(self):
+        super()._sync()
+        self._sync_bitboards()
+
+    def _sync_bitboards(self):
+        self.pieces = [[0] * 6, [0] * 6]
+        self.occupied = [0, 0]
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = self.squares[row][col].piece
+                if piece:
+                    self._set_bit(piece, row * 8 + col)
+
+    def _set_bit(self, piece, sq):
+        bit = 1 << sq
+        color = COLOR_INDEX[piece.color]
+        self.pieces[color][TYPE_INDEX[type(piece)]] |= bit
+        self.occupied[color] |= bit
+
+    def _place(self, piece, row, col):
+        super()._place(piece, row, col)
+        self._set_bit(piece, row * 8 + col)
+
+    def _lift(self, row, col):
+        piece = super()._lift(row, col)
+        if piece:
+            bit = ~(1 << (row * 8 + col))
+            color = COLOR_INDEX[piece.color]
+            self.pieces[color][TYPE_INDEX[type(piece)]] &= bit
+            self.occupied[color] &= bit
+        return piece
+
+    def attackers_of(self, sq, color, occupied=None, keep=-1):
+        '''
+        Bitboard of color's (0 white, 1 black) pieces attacking square sq
+        '''
+        if occupied is None:
+            occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        pieces = self.pieces[color]
+        queens = pieces[QUEEN]
+        return ((KNIGHT_ATTACKS[sq] & pieces[KNIGHT]
+                 | PAWN_ATTACKS[color ^ 1][sq] & pieces[PAWN]
+                 | KING_ATTACKS[sq] & pieces[KING]
+                 | slide(BISHOP_RAYS[sq], occupied) & (pieces[BISHOP] | queens)
+                 | slide(ROOK_RAYS[sq], occupied) & (pieces[ROOK] | queens)) & keep)
+
+    def attacked(self, sq, color, occupied=None, keep=-1):
+        '''
+        Is square sq attacked by color (0 white, 1 black)?
+        occupied and keep let callers test a position after a move
+        without playing it: keep masks out captured pieces
+        '''
+        if occupied is None:
+            occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        pieces = self.pieces[color]
+        if KNIGHT_ATTACKS[sq] & pieces[KNIGHT] & keep:
+            return True
+        if PAWN_ATTACKS[color ^ 1][sq] & pieces[PAWN] & keep:
+            return True
+        if KING_ATTACKS[sq] & pieces[KING]:
+            return True
+        queens = pieces[QUEEN]
+        diagonal = (pieces[BISHOP] | queens) & keep & BISHOP_MASKS[sq]
+        if diagonal and slide(BISHOP_RAYS[sq], occupied) & diagonal:
+            return True
+        straight = (pieces[ROOK] | queens) & keep & ROOK_MASKS[sq]
+        if straight and slide(ROOK_RAYS[sq], occupied) & straight:
+            return True
+        return False
+
+    def is_attacked(self, row, col, color):
+        return self.attacked(row * 8 + col, COLOR_INDEX[color])
+
+    def attacked_by(self, row, col, color):
+        squares = []
+        attackers = self.attackers_of(row * 8 + col, COLOR_INDEX[color])
+        while attackers:
+            bit = attackers & -attackers
+            attackers ^= bit
+            sq = bit.bit_length() - 1
+            squares.append((sq // 8, sq % 8))
+        return squares
+
+    def is_in_check(self, color):
+        us = COLOR_INDEX[color]
+        king = self.pieces[us][KING]
+        if not king:
+            return False
+        return self.attacked(king.bit_length() - 1, us ^ 1)
+
+    def _piece_squares(self, color):
+        squares = []
+        own = self.occupied[COLOR_INDEX[color]]
+        while own:
+            bit = own & -own
+            own ^= bit
+            sq = bit.bit_length() - 1
+            squares.append((sq // 8, sq % 8))
+        return squares
+
+    def calc_moves(self, piece, row, col, bool=True):
+        '''
+        Calculate all the possible/valid moves on a specific piece on a
+        specific position, same results as Board.calc_moves
+        '''
+        piece.clear_moves()
+        us = COLOR_INDEX[piece.color]
+        them = us ^ 1
+        sq = row * 8 + col
+        own = self.occupied[us]
+        enemy = self.occupied[them]
+        occupied = own | enemy
+        kind = TYPE_INDEX[type(piece)]
+
+        # target squares
+        ep_target = None
+        if kind == PAWN:
+            targets = PAWN_ATTACKS[us][sq] & enemy
+            step = row + piece.dir
+            if Square.inrange(step) and not occupied >> (step * 8 + col) & 1:
+                targets |= 1 << (step * 8 + col)
+                jump = step + piece.dir
+                if not piece.moved and Square.inrange(jump) and not occupied >> (jump * 8 + col) & 1:
+                    targets |= 1 << (jump * 8 + col)
+            # en passant
+            if row == (3 if piece.color == 'white' else 4):
+                for c in (col - 1, col + 1):
+                    if Square.inrange(c):
+                        p = self.squares[row][c].piece
+                        if isinstance(p, Pawn) and p.color != piece.color and p.en_passant:
+                            ep_target = (step * 8 + c, row * 8 + c)
+                            targets |= 1 << ep_target[0]
+        elif kind == KNIGHT:
+            targets = KNIGHT_ATTACKS[sq] & ~own
+        elif kind == BISHOP:
+            targets = slide(BISHOP_RAYS[sq], occupied) & ~own
+        elif kind == ROOK:
+            targets = slide(ROOK_RAYS[sq], occupied) & ~own
+        elif kind == QUEEN:
+            targets = (slide(BISHOP_RAYS[sq], occupied) | slide(ROOK_RAYS[sq], occupied)) & ~own
+        else:
+            targets = KING_ATTACKS[sq] & ~own
+
+        king = self.pieces[us][KING]
+        king_sq = king.bit_length() - 1 if king else None
+        initial = Square(row, col)
+        from_bit = 1 << sq
+
+        if bool and king_sq is not None and kind != KING:
+            # check and pin masks settle every move but en passant, whose
+            # taken pawn is tested with the position after the capture
+            checkers, evasions, pins, xray = self._legality(piece.color)
+            ep_bit = 1 << ep_target[0] if ep_target else 0
+            targets = targets & ~ep_bit & evasions & pins.get(sq, ALL_SQUARES)
+            if ep_bit:
+                after = (occupied & ~from_bit & ~(1 << ep_target[1])) | ep_bit
+                if not self.attacked(king_sq, them, after, ~(1 << ep_target[1])):
+                    targets |= ep_bit
+
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            target = bit.bit_length() - 1
+
+            if bool and kind == KING:
+                # the king's square is left empty so sliders see through it
+                if self.attacked(target, them, occupied & ~from_bit, ~bit):
+                    continue
+
+            final_row, final_col = target // 8, target % 8
+            final = Square(final_row, final_col, self.squares[final_row][final_col].piece)
+            piece.add_move(Move(initial, final))
+
+        # castling
+        if kind == KING and not piece.moved:
+            self._castling_moves(piece, row, col, us, occupied, bool)
+
+    def _castling_moves(self, piece, row, col, us, occupied, bool):
+        them = us ^ 1
+        if bool and self.attacked(row * 8 + col, them):
+            return
+        # (rook col, squares that must be empty, squares the king crosses)
+        for rook_col, empty, crossed in ((0, (1, 2, 3), (3, 2)), (7, (5, 6), (5, 6))):
+            rook = self.squares[row][rook_col].piece
+            if not isinstance(rook, Rook) or rook.moved:
+                continue
+            if any(occupied >> (row * 8 + c) & 1 for c in empty):
+                continue
+            if bool and any(self.attacked(row * 8 + c, them) for c in crossed):
+                continue
+            piece.add_move(Move(Square(row, col), Square(row, crossed[-1])))
+
+
+# position backends selectable by name
+BACKENDS = {
+    'grid': Board,
+    'bitboard': BitBoard,
+}
@@ -1,68 +1,551 @@
+from array import array
+from collections import OrderedDict
+
 from const import *
 from square import Square
 from piece import *
-from move import Move
-import copy
+from move import Move, FILES
+import zobrist
+from evaluation import PIECE_SQUARE, PHASES
+
+KNIGHT_OFFSETS = [(-2, 1), (-1, 2), (1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1)]
+KING_OFFSETS = [(-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1)]
+SLIDES = {
+    Bishop: [(-1, 1), (-1, -1), (1, 1), (1, -1)],
+    Rook: [(-1, 0), (0, 1), (1, 0), (0, -1)],
+    Queen: [(-1, 1), (-1, -1), (1, 1), (1, -1), (-1, 0), (0, 1), (1, 0), (0, -1)],
+}
+
+
+def _jumps(offsets):
+    # targets[row][col]: the on-board squares one offset away
+    return [[[(row + r, col + c) for r, c in offsets if Square.inrange(row + r, col + c)]
+             for col in range(COLS)] for row in range(ROWS)]
+
+
+def _rays(incrs):
+    # rays[row][col]: per direction the squares from nearest to the edge
+    table = [[[] for col in range(COLS)] for row in range(ROWS)]
+    for row in range(ROWS):
+        for col in range(COLS):
+            for row_incr, col_incr in incrs:
+                ray = []
+                r, c = row + row_incr, col + col_incr
+                while Square.inrange(r, c):
+                    ray.append((r, c))
+                    r, c = r + row_incr, c + col_incr
+                if ray:
+                    table[row][col].append(ray)
+    return table
+
+
+# move targets computed once, calc_moves and the attack maps only look them up
+KNIGHT_TARGETS = _jumps(KNIGHT_OFFSETS)
+KING_TARGETS = _jumps(KING_OFFSETS)
+SLIDE_RAYS = {kind: _rays(incrs) for kind, incrs in SLIDES.items()}
+# pushes hold one or two squares, the second only counts for an unmoved pawn
+PAWN_PUSHES = {'white': _jumps([(-1, 0), (-2, 0)]), 'black': _jumps([(1, 0), (2, 0)])}
+PAWN_CAPTURES = {'white': _jumps([(-1, -1), (-1, 1)]), 'black': _jumps([(1, -1), (1, 1)])}
+# KING_LINES[row][col]: the queen rays from a square with the sliders that move along them
+KING_LINES = [[[(ray, (Bishop, Queen) if ray[0][0] != row and ray[0][1] != col else (Rook, Queen))
+                for ray in SLIDE_RAYS[Queen][row][col]] for col in range(COLS)] for row in range(ROWS)]
+ALL_SQUARES = (1 << 64) - 1
+
+# game_over values of drawn games
+DRAWS = ('stalemate', 'repetition', 'fifty')
+
+# positions whose legal move lists a board keeps, least recently used go first
+MOVE_CACHE_SIZE = 1024
+
+# nibble codes of the pieces in Board.pack, black pieces add 8
+PIECE_CODES = {'pawn': 1, 'knight': 2, 'bishop': 3, 'rook': 4, 'queen': 5, 'king': 6}
+CODE_PIECES = {1: Pawn, 2: Knight, 3: Bishop, 4: Rook, 5: Queen, 6: King}
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# FEN piece letters, upper case for white
+FEN_PIECES = {'p': Pawn, 'n': Knight, 'b': Bishop, 'r': Rook, 'q': Queen, 'k': King}
+FEN_LETTERS = {'pawn': 'p', 'knight': 'n', 'bishop': 'b', 'rook': 'r', 'queen': 'q', 'king': 'k'}
 
 class Board:
+    # keep per-color attack maps up to date on every board change
+    track_attacks = True
+
     def __init__(self):
+        self._reset()
+        self._add_pieces("white")
+        self._add_pieces('black')
+        self._sync()
+        self.start_fen = START_FEN
+
+    def _reset(self):
+        # empty board, white to move
         self.squares = [[0, 0, 0, 0, 0, 0, 0, 0,] for col in range(COLS)]
         self.last_move = None
         self.promotion_pending = None  # info о промоции
-        self.game_over = None  # None, 'white', 'black', 'stalemate'
+        self.game_over = None  # None, 'white', 'black' or one of DRAWS
+        self.en_passant_pawn = None  # pawn that just made a double step
+        self.next_player = 'white'  # side to move
+        self.halfmove_clock = 0  # plies since the last capture or pawn move
+        self.fullmove_number = 1
+        self.start_fen = None  # position move_stack starts from
+        self.move_stack = []  # moves played with make_move
+        self.history = array('Q')  # position hashes since the start, current one last
+        self.repetitions = {}  # hash -> times it is in history
+        self.move_cache = OrderedDict()  # (hash, color) -> legal moves, see get_all_possible_moves
         self._create()
-        self._add_pieces("white")
-        self._add_pieces('black')
+
+    def pack(self):
+        '''
+        Compact bytes of the position: 32 bytes of piece nibbles, one
+        byte of side to move and castling rights, one en passant file
+        byte (8 for none)
+        '''
+        codes = self.codes
+        data = bytearray(low | high << 4 for low, high in zip(codes[0::2], codes[1::2]))
+        target = self.en_passant_square()
+        data.append((self.next_player == 'black') | self.castling << 1)
+        data.append(target[1] if target else 8)
+        return bytes(data)
+
+    @classmethod
+    def unpack(cls, data):
+        '''
+        Board of this class from the bytes of pack
+        '''
+        board = cls.__new__(cls)
+        board._reset()
+        for sq in range(ROWS * COLS):
+            code = data[sq >> 1] >> (4 * (sq & 1)) & 15
+            if code:
+                color = 'black' if code & 8 else 'white'
+                board.squares[sq // 8][sq % 8].piece = CODE_PIECES[code & 7](color)
+        board.next_player = 'black' if data[32] & 1 else 'white'
+        board._set_moved_flags(data[32] >> 1)
+        if data[33] < COLS:
+            # the pawn that just made a double step belongs to the other side
+            row = 3 if board.next_player == 'white' else 4
+            board.set_true_en_passant(board.squares[row][data[33]].piece)
+        board._sync()
+        board.start_fen = board.to_fen()
+        return board
+
+    @classmethod
+    def from_fen(cls, fen):
+        '''
+        Board of this class set up from a FEN string, the move counters
+        may be left out
+        '''
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f'bad FEN {fen!r}')
+        placement, side, castling, en_passant = fields[:4]
+        ranks = placement.split('/')
+        if len(ranks) != ROWS or side not in ('w', 'b'):
+            raise ValueError(f'bad FEN {fen!r}')
+
+        board = cls.__new__(cls)
+        board._reset()
+        for row, rank in enumerate(ranks):
+            col = 0
+            for char in rank:
+                if char.isdigit():
+                    col += int(char)
+                elif char.lower() in FEN_PIECES and col < COLS:
+                    color = 'white' if char.isupper() else 'black'
+                    board.squares[row][col].piece = FEN_PIECES[char.lower()](color)
+                    col += 1
+                else:
+                    raise ValueError(f'bad FEN {fen!r}')
+            if col != COLS:
+                raise ValueError(f'bad FEN {fen!r}')
+
+        board.next_player = 'white' if side == 'w' else 'black'
+        rights = 0
+        for char, right in zip('KQkq', (zobrist.WHITE_SHORT, zobrist.WHITE_LONG,
+                                        zobrist.BLACK_SHORT, zobrist.BLACK_LONG)):
+            if char in castling:
+                rights |= right
+        board._set_moved_flags(rights)
+        if en_passant != '-':
+            # the square a pawn of the other side just skipped: rank 6 with
+            # white to move, rank 3 with black, the pawn one rank past it
+            if (len(en_passant) != 2 or en_passant[0] not in FILES
+                    or en_passant[1] != ('6' if side == 'w' else '3')):
+                raise ValueError(f'bad en passant square in FEN {fen!r}')
+            col = FILES.index(en_passant[0])
+            row = ROWS - int(en_passant[1]) + (1 if side == 'w' else -1)
+            pawn = board.squares[row][col].piece
+            if not isinstance(pawn, Pawn) or pawn.color == board.next_player:
+                raise ValueError(f'no pawn for the en passant square in FEN {fen!r}')
+            board.set_true_en_passant(pawn)
+        if len(fields) >= 6:
+            board.halfmove_clock = int(fields[4])
+            board.fullmove_number = int(fields[5])
+        board._sync()
+        board.start_fen = fen
+        return board
+
+    def to_fen(self):
+        '''
+        FEN string of the position
+        '''
+        ranks = []
+        for row in range(ROWS):
+            rank, empty = '', 0
+            for col in range(COLS):
+                piece = self.squares[row][col].piece
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                letter = FEN_LETTERS[piece.name]
+                rank += letter.upper() if piece.color == 'white' else letter
+            ranks.append(rank + (str(empty) if empty else ''))
+
+        castling = ''.join(char for char, right in zip('KQkq', (
+            zobrist.WHITE_SHORT, zobrist.WHITE_LONG, zobrist.BLACK_SHORT, zobrist.BLACK_LONG))
+            if self.castling & right) or '-'
+        en_passant = '-'
+        target = self.en_passant_square()
+        if target:
+            en_passant = FILES[target[1]] + str(ROWS - target[0])
+        side = 'w' if self.next_player == 'white' else 'b'
+        return ' '.join(['/'.join(ranks), side, castling, en_passant,
+                         str(self.halfmove_clock), str(self.fullmove_number)])
+
+    def en_passant_square(self):
+        '''
+        (row, col) the last double step skipped, None if there was none
+        '''
+        pawn = self.en_passant_pawn
+        if pawn:
+            row = 4 if pawn.color == 'white' else 3
+            for col in range(COLS):
+                if self.squares[row][col].piece is pawn:
+                    return row - pawn.dir, col
+        return None
+
+    def _set_moved_flags(self, rights):
+        '''
+        Moved flags matching a castling rights mask: pawns on their start
+        rank have not moved, kings and rooks only if they keep a right
+        '''
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = self.squares[row][col].piece
+                if piece:
+                    start = 6 if piece.color == 'white' else 1
+                    piece.moved = not (isinstance(piece, Pawn) and row == start)
+        for row, short, long in ((7, zobrist.WHITE_SHORT, zobrist.WHITE_LONG),
+                                 (0, zobrist.BLACK_SHORT, zobrist.BLACK_LONG)):
+            for col, right in ((4, short | long), (7, short), (0, long)):
+                piece = self.squares[row][col].piece
+                if piece and rights & right:
+                    piece.moved = False
 
     def move(self, piece, move):
+        self.make_move(move)
+
+        # clear valid moves
+        piece.clear_moves()
+
+        # pawn promotion
+        if isinstance(piece, Pawn) and self.check_promotion_needed(piece, move.final):
+            self.promotion_pending = {
+                'piece': piece,
+                'position': move.final,
+                'color': piece.color
+            }
+            return True  # Возвращаем True, чтобы указать, что нужна промоция
+
+        return False  # Промоция не нужна
+
+    def make_move(self, move):
+        '''
+        Play a move in place and return an undo token for unmake_move.
+        Handles captures, en passant, castling and promotion (when
+        move.promotion is set, otherwise the pawn waits for promote_pawn)
+        '''
         initial = move.initial
         final = move.final
+        key = self.hash
 
-        en_passant_empty = self.squares[final.row][final.col].isempty()
+        piece = self._lift(initial.row, initial.col)
 
-        # console board move update
-        self.squares[initial.row][initial.col].piece = None
-        self.squares[final.row][final.col].piece = piece
+        # capture, en passant capture removes the pawn beside us
+        cap_row, cap_col = final.row, final.col
+        captured = self._lift(final.row, final.col)
+        if captured is None and isinstance(piece, Pawn) and final.col != initial.col:
+            cap_row = initial.row
+            captured = self._lift(cap_row, cap_col)
 
-        # pawn en passant 
-        # pawn promotion
+        # promotion
+        promoted = None
+        if isinstance(piece, Pawn) and move.promotion and self.check_promotion_needed(piece, final):
+            promoted = PROMOTIONS[move.promotion](piece.color)
+            promoted.moved = True
+            self._place(promoted, final.row, final.col)
+        else:
+            self._place(piece, final.row, final.col)
+
+        # king castling
+        castle = None
+        if isinstance(piece, King) and self.casteling(initial, final):
+            rook_col, rook_final_col = (0, 3) if final.col < initial.col else (7, 5)
+            rook = self._lift(initial.row, rook_col)
+            self._place(rook, initial.row, rook_final_col)
+            castle = (rook, rook_col, rook_final_col, rook.moved)
+            rook.moved = True
+
+        token = (move, piece, piece.moved, captured, cap_row, cap_col, promoted, castle,
+                 self.en_passant_pawn, self.last_move, self.next_player,
+                 key, self.castling, self.ep_key, self.halfmove_clock, self.fullmove_number)
+
+        # en passant is only available right after a double step
+        if self.en_passant_pawn:
+            self.en_passant_pawn.en_passant = False
+        if isinstance(piece, Pawn) and abs(final.row - initial.row) == 2:
+            piece.en_passant = True
+            self.en_passant_pawn = piece
+        else:
+            self.en_passant_pawn = None
+
+        piece.moved = True
+        self.last_move = move
+
+        # move counters
+        if isinstance(piece, Pawn) or captured:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if piece.color == 'black':
+            self.fullmove_number += 1
+
+        # position key: side to move, castling rights and en passant file
+        if self.next_player == piece.color:
+            self.next_player = 'black' if piece.color == 'white' else 'white'
+            self.hash ^= zobrist.TURN
+        if isinstance(piece, King) or isinstance(piece, Rook) or isinstance(captured, Rook):
+            rights = self.castling_rights()
+            self.hash ^= zobrist.CASTLING[self.castling] ^ zobrist.CASTLING[rights]
+            self.castling = rights
+        ep_key = self._en_passant_key(final.row, final.col) if self.en_passant_pawn else 0
+        self.hash ^= self.ep_key ^ ep_key
+        self.ep_key = ep_key
+        self.move_stack.append(move)
+        self._push_history()
+        return token
+
+    def unmake_move(self, token):
+        '''
+        Take back a move played with make_move
+        '''
+        (move, piece, moved, captured, cap_row, cap_col, promoted, castle,
+         en_passant_pawn, last_move, next_player, key, castling, ep_key,
+         halfmove_clock, fullmove_number) = token
+        initial = move.initial
+        final = move.final
+
+        if castle:
+            rook, rook_col, rook_final_col, rook_moved = castle
+            self._lift(initial.row, rook_final_col)
+            self._place(rook, initial.row, rook_col)
+            rook.moved = rook_moved
+
+        self._lift(final.row, final.col)
+        if captured:
+            self._place(captured, cap_row, cap_col)
+        self._place(piece, initial.row, initial.col)
+        piece.moved = moved
+
+        if self.en_passant_pawn:
+            self.en_passant_pawn.en_passant = False
+        if en_passant_pawn:
+            en_passant_pawn.en_passant = True
+        self.en_passant_pawn = en_passant_pawn
+
+        self.last_move = last_move
+        self.next_player = next_player
+        self.hash = key
+        self.castling = castling
+        self.ep_key = ep_key
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.move_stack.pop()
+        self._pop_history()
+
+    def _push_history(self):
+        self.history.append(self.hash)
+        self.repetitions[self.hash] = self.repetitions.get(self.hash, 0) + 1
+
+    def _pop_history(self):
+        key = self.history.pop()
+        if self.repetitions[key] == 1:
+            del self.repetitions[key]
+        else:
+            self.repetitions[key] -= 1
+
+    def is_repetition(self, count=3):
+        '''
+        Has the current position (same pieces, side to move, castling
+        rights and en passant file) occurred count times in the game?
+        '''
+        return self.repetitions.get(self.hash, 0) >= count
+
+    def is_fifty_moves(self):
+        # fifty moves of each side without a capture or pawn move
+        return self.halfmove_clock >= 100
+
+    def _place(self, piece, row, col):
+        self.squares[row][col].piece = piece
+        self.codes[row * 8 + col] = PIECE_CODES[piece.name] | (8 if piece.color == 'black' else 0)
+        self.legality = None
+        self.hash ^= zobrist.PIECES[(piece.name, piece.color)][row * 8 + col]
+        mg, eg = PIECE_SQUARE[(piece.name, piece.color)][row * 8 + col]
+        self.mg_score += mg
+        self.eg_score += eg
+        self.phase += PHASES[piece.name]
+        if isinstance(piece, King):
+            self.kings[piece.color] = (row, col)
+        if self.track_attacks:
+            sq = row * 8 + col
+            self._refresh_sliders(sq)
+            self._add_cover(piece, sq)
+
+    def _lift(self, row, col):
+        square = self.squares[row][col]
+        piece = square.piece
+        square.piece = None
+        self.codes[row * 8 + col] = 0
+        self.legality = None
+        if piece:
+            self.hash ^= zobrist.PIECES[(piece.name, piece.color)][row * 8 + col]
+            mg, eg = PIECE_SQUARE[(piece.name, piece.color)][row * 8 + col]
+            self.mg_score -= mg
+            self.eg_score -= eg
+            self.phase -= PHASES[piece.name]
+            if self.track_attacks:
+                sq = row * 8 + col
+                self._remove_cover(piece, sq)
+                self._refresh_sliders(sq)
+        return piece
+
+    def _sync(self):
+        '''
+        Rebuild king squares, attack maps and the position key from the
+        squares grid
+        '''
+        self.hash = 0
+        self.ep_key = 0
+        # running evaluation sums, see evaluation.py
+        self.mg_score = 0
+        self.eg_score = 0
+        self.phase = 0
+        self.legality = None  # (color, Board._legality result) of the current position
+        self.kings = {'white': None, 'black': None}
+        # codes[sq]: PIECE_CODES of the piece on sq, | 8 for black, 0 when empty
+        self.codes = bytearray(ROWS * COLS)
+        if self.track_attacks:
+            # attackers[color][sq] = squares of color's pieces covering sq
+            self.attackers = {
+                'white': [set() for sq in range(ROWS * COLS)],
+                'black': [set() for sq in range(ROWS * COLS)],
+            }
+            self.covers = [None] * (ROWS * COLS)
+        for row in range(ROWS):
+            for col in range(COLS):
+                piece = self.squares[row][col].piece
+                if piece:
+                    self.codes[row * 8 + col] = PIECE_CODES[piece.name] | (8 if piece.color == 'black' else 0)
+                    self.hash ^= zobrist.PIECES[(piece.name, piece.color)][row * 8 + col]
+                    mg, eg = PIECE_SQUARE[(piece.name, piece.color)][row * 8 + col]
+                    self.mg_score += mg
+                    self.eg_score += eg
+                    self.phase += PHASES[piece.name]
+                    if isinstance(piece, King):
+                        self.kings[piece.color] = (row, col)
+                    if self.track_attacks:
+                        self._add_cover(piece, row * 8 + col)
+                    if piece is self.en_passant_pawn:
+                        self.ep_key = self._en_passant_key(row, col)
+        self.castling = self.castling_rights()
+        self.hash ^= zobrist.CASTLING[self.castling] ^ self.ep_key
+        if self.next_player == 'white':
+            self.hash ^= zobrist.TURN
+        self.history = array('Q', [self.hash])
+        self.repetitions = {self.hash: 1}
+
+    def castling_rights(self):
+        '''
+        Castling rights mask (zobrist.WHITE_SHORT, ...) read from the
+        moved flags of the kings and rooks on their home squares
+        '''
+        rights = 0
+        for color, row, short, long in (('white', 7, zobrist.WHITE_SHORT, zobrist.WHITE_LONG),
+                                        ('black', 0, zobrist.BLACK_SHORT, zobrist.BLACK_LONG)):
+            king = self.squares[row][4].piece
+            if not isinstance(king, King) or king.color != color or king.moved:
+                continue
+            for col, right in ((7, short), (0, long)):
+                rook = self.squares[row][col].piece
+                if isinstance(rook, Rook) and rook.color == color and not rook.moved:
+                    rights |= right
+        return rights
+
+    def _en_passant_key(self, row, col):
+        # like Polyglot, only hash the file when an enemy pawn can take
+        pawn = self.squares[row][col].piece
+        for c in (col - 1, col + 1):
+            if Square.inrange(c):
+                p = self.squares[row][c].piece
+                if isinstance(p, Pawn) and p.color != pawn.color:
+                    return zobrist.EN_PASSANT[col]
+        return 0
+
+    def _cover(self, piece, row, col):
+        '''
+        Squares a piece attacks or defends, sliders stop on the first
+        occupied square
+        '''
         if isinstance(piece, Pawn):
-            diff = final.col - initial.col
-            if diff != 0 and en_passant_empty:
-                # console board move update
-                self.squares[initial.row][initial.col + diff].piece = None
-                self.squares[final.row][final.col].piece = piece
-
-            if self.check_promotion_needed(piece, final):
-                self.promotion_pending = {
-                    'piece': piece,
-                    'position': final,
-                    'color': piece.color
-                }
-                return True  # Возвращаем True, чтобы указать, что нужна промоция
-
-        # king castling - ИСПРАВЛЕНИ
+            return [r * 8 + c for r, c in PAWN_CAPTURES[piece.color][row][col]]
+        if isinstance(piece, Knight):
+            return [r * 8 + c for r, c in KNIGHT_TARGETS[row][col]]
         if isinstance(piece, King):
-            if self.casteling(initial, final):
-                diff = final.col - initial.col
-                rook = piece.left_rook if (diff < 0) else piece.right_rook
-                if rook and len(rook.moves) > 0:
-                    # Перемещаем ладью напрямую без рекурсивного вызова move
-                    rook_move = rook.moves[-1]
-                    self.squares[rook_move.initial.row][rook_move.initial.col].piece = None
-                    self.squares[rook_move.final.row][rook_move.final.col].piece = rook
-                    rook.moved = True
-                    rook.clear_moves()
-
-        # move
-        piece.moved = True
+            return [r * 8 + c for r, c in KING_TARGETS[row][col]]
+        cover = []
+        squares = self.squares
+        for ray in SLIDE_RAYS[type(piece)][row][col]:
+            for r, c in ray:
+                cover.append(r * 8 + c)
+                if squares[r][c].piece:
+                    break
+        return cover
 
-        # clear valid moves
-        piece.clear_moves()
+    def _add_cover(self, piece, sq):
+        cover = self._cover(piece, sq // 8, sq % 8)
+        self.covers[sq] = cover
+        attackers = self.attackers[piece.color]
+        for target in cover:
+            attackers[target].add(sq)
 
-        # set last move
-        self.last_move = move
-        return False  # Промоция не нужна
+    def _remove_cover(self, piece, sq):
+        attackers = self.attackers[piece.color]
+        for target in self.covers[sq]:
+            attackers[target].discard(sq)
+        self.covers[sq] = None
+
+    def _refresh_sliders(self, sq):
+        # sliders reaching sq are cut off or extended when it changes
+        for color in ('white', 'black'):
+            for source in list(self.attackers[color][sq]):
+                piece = self.squares[source // 8][source % 8].piece
+                if type(piece) in SLIDES:
+                    self._remove_cover(piece, source)
+                    self._add_cover(piece, source)
 
     def check_promotion_needed(self, piece, final):
         return final.row == 0 or final.row == 7
@@ -78,98 +561,284 @@ class Board:
         color = self.promotion_pending['color']
         
         # Создаем новую фигуру в зависимости от выбора
-        if piece_type == 'queen':
-            new_piece = Queen(color)
-        elif piece_type == 'rook':
-            new_piece = Rook(color)
-        elif piece_type == 'bishop':
-            new_piece = Bishop(color)
-        elif piece_type == 'knight':
-            new_piece = Knight(color)
-        else:
-            new_piece = Queen(color)  # По умолчанию королева
-        
+        new_piece = PROMOTIONS.get(piece_type, Queen)(color)  # По умолчанию королева
+
         # Помещаем новую фигуру на доску
-        self.squares[position.row][position.col].piece = new_piece
+        self._lift(position.row, position.col)
+        self._place(new_piece, position.row, position.col)
         new_piece.moved = True
+
+        # the position after the move has changed, so has its history entry
+        self._pop_history()
+        self._push_history()
+
+        # the recorded move now says what the pawn became
+        if self.move_stack:
+            last = self.move_stack[-1]
+            self.move_stack[-1] = Move(last.initial, last.final, new_piece.name)
         
         # Очищаем состояние промоции
         self.promotion_pending = None
 
     def find_king(self, color):
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = self.squares[row][col].piece
-                if isinstance(piece, King) and piece.color == color:
-                    return (row, col)
-        return None
+        return self.kings[color]
+
+    def is_attacked(self, row, col, color):
+        '''
+        Is the square attacked (or defended, if it holds one of color's
+        own pieces) by any piece of color
+        '''
+        return bool(self.attackers[color][row * 8 + col])
+
+    def attacked_by(self, row, col, color):
+        return [(sq // 8, sq % 8) for sq in self.attackers[color][row * 8 + col]]
+
+    def checkers(self, color):
+        '''
+        Squares of the enemy pieces giving check to color's king
+        '''
+        king_pos = self.kings[color]
+        if not king_pos:
+            return []
+        enemy = 'black' if color == 'white' else 'white'
+        return self.attacked_by(king_pos[0], king_pos[1], enemy)
 
     def is_in_check(self, color):
-        king_pos = self.find_king(color)
+        king_pos = self.kings[color]
         if not king_pos:
             return False
-        
-        king_row, king_col = king_pos
-        
-        # Проверяем все фигуры противника
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = self.squares[row][col].piece
-                if piece and piece.color != color:
-                    # Вычисляем возможные ходы без проверки шаха
-                    self.calc_moves(piece, row, col, bool=False)
-                    for move in piece.moves:
-                        if move.final.row == king_row and move.final.col == king_col:
-                            return True
+        enemy = 'black' if color == 'white' else 'white'
+        return self.is_attacked(king_pos[0], king_pos[1], enemy)
+
+    def _legality(self, color):
+        '''
+        Checks and absolute pins of color's king, worked out once per
+        position: (checkers, evasions, pins, xray).
+        checkers: squares of the pieces giving check.
+        evasions: bitmask of the squares a move other than a king move
+        must end on, every square out of check, the checker and the
+        squares between in single check, none in double check.
+        pins: square of a pinned piece -> bitmask of its pin line, the
+        pinner included.
+        xray: squares behind the king on the lines of checking sliders,
+        still attacked once the king steps back along them
+        '''
+        if self.legality and self.legality[0] == color:
+            return self.legality[1]
+        checkers, checks, pins, xray = [], [], {}, 0
+        king_pos = self.kings[color]
+        if king_pos:
+            kr, kc = king_pos
+            squares = self.squares
+            for kind, targets in ((Knight, KNIGHT_TARGETS), (Pawn, PAWN_CAPTURES[color])):
+                for r, c in targets[kr][kc]:
+                    p = squares[r][c].piece
+                    if isinstance(p, kind) and p.color != color:
+                        checkers.append(r * 8 + c)
+                        checks.append(1 << (r * 8 + c))
+            for ray, sliders in KING_LINES[kr][kc]:
+                line = 0
+                blocker = None  # own piece met on the ray
+                for r, c in ray:
+                    line |= 1 << (r * 8 + c)
+                    p = squares[r][c].piece
+                    if p is None:
+                        continue
+                    if p.color == color:
+                        if blocker is not None:
+                            break
+                        blocker = r * 8 + c
+                        continue
+                    if isinstance(p, sliders):
+                        if blocker is None:
+                            checkers.append(r * 8 + c)
+                            checks.append(line)
+                            br, bc = 2 * kr - ray[0][0], 2 * kc - ray[0][1]
+                            if Square.inrange(br, bc):
+                                xray |= 1 << (br * 8 + bc)
+                        else:
+                            pins[blocker] = line
+                    break
+        evasions = ALL_SQUARES if not checks else checks[0] if len(checks) == 1 else 0
+        result = (checkers, evasions, pins, xray)
+        self.legality = (color, result)
+        return result
+
+    def _exposed(self, color, empty, filled):
+        '''
+        Would an enemy slider see color's king with the squares in empty
+        vacated and the square filled taken? En passant clears two
+        squares of one row at once, pins do not cover that
+        '''
+        kr, kc = self.kings[color]
+        squares = self.squares
+        for ray, sliders in KING_LINES[kr][kc]:
+            for r, c in ray:
+                sq = r * 8 + c
+                if sq == filled:
+                    break
+                p = squares[r][c].piece
+                if p is None or sq in empty:
+                    continue
+                if p.color != color and isinstance(p, sliders):
+                    return True
+                break
         return False
 
+    def __getstate__(self):
+        # copies and pickles start with an empty move cache
+        state = self.__dict__.copy()
+        state['move_cache'] = OrderedDict()
+        return state
+
     def get_all_possible_moves(self, color):
+        '''
+        Legal moves of color, generated once per position: the lists are
+        kept in move_cache by position key, bounded to MOVE_CACHE_SIZE
+        positions with LRU eviction. Returns a fresh list
+        '''
+        moves = self.move_cache.get((self.hash, color))
+        if moves is None:
+            return list(self.iter_legal_moves(color))
+        self.move_cache.move_to_end((self.hash, color))
+        return list(moves)
+
+    def iter_legal_moves(self, color):
+        '''
+        Lazy legal moves of color, one piece at a time: the king first,
+        captures before quiet moves of every piece. A caller that stops
+        early skips the rest of the generation, a run to the end stores
+        the list in move_cache. The board must not change meanwhile
+        '''
+        key = (self.hash, color)
+        cached = self.move_cache.get(key)
+        if cached is not None:
+            yield from cached
+            return
         moves = []
-        for row in range(ROWS):
-            for col in range(COLS):
-                piece = self.squares[row][col].piece
-                if piece and piece.color == color:
-                    self.calc_moves(piece, row, col, bool=True)
-                    moves.extend(piece.moves)
+        king_pos = self.kings[color]
+        squares = self._piece_squares(color)
+        if king_pos in squares:
+            squares.remove(king_pos)
+            squares.insert(0, king_pos)
+        for row, col in squares:
+            # taken out of calc_moves' list, the piece keeps the moves it had
+            # (what the GUI shows)
+            piece = self.squares[row][col].piece
+            kept = piece.moves, piece.targets
+            self.calc_moves(piece, row, col, bool=True)
+            piece_moves = piece.moves
+            piece.moves, piece.targets = kept
+            captures = [move for move in piece_moves if self.squares[move.final.row][move.final.col].piece]
+            if captures:
+                quiet = [move for move in piece_moves if not self.squares[move.final.row][move.final.col].piece]
+                piece_moves = captures + quiet
+            for move in piece_moves:
+                yield move
+            moves.extend(piece_moves)
+        cache = self.move_cache
+        cache[key] = moves
+        if len(cache) > MOVE_CACHE_SIZE:
+            cache.popitem(last=False)
+
+    def has_legal_move(self, color):
+        '''
+        Does color have any legal move? Stops at the first one found
+        '''
+        for move in self.iter_legal_moves(color):
+            return True
+        return False
+
+    def _piece_squares(self, color):
+        # (row, col) of color's pieces
+        return [(row, col) for row in range(ROWS) for col in range(COLS)
+                if self.squares[row][col].piece and self.squares[row][col].piece.color == color]
+
+    def load_moves(self, piece, row, col):
+        '''
+        Fill piece.moves with its legal moves, taken from the position's
+        cached move list (what a click in the GUI needs)
+        '''
+        # the list first: generating it may refill piece.moves on the way
+        moves = [move for move in self.get_all_possible_moves(piece.color)
+                 if move.initial.row == row and move.initial.col == col]
+        piece.clear_moves()
+        for move in moves:
+            piece.add_move(move)
+
+    def legal_moves(self, color=None):
+        '''
+        Legal moves of color (side to move by default) ready for
+        make_move: pawn moves to the last rank come once per promotion
+        '''
+        color = color or self.next_player
+        moves = []
+        for move in self.get_all_possible_moves(color):
+            piece = self.squares[move.initial.row][move.initial.col].piece
+            if isinstance(piece, Pawn) and self.check_promotion_needed(piece, move.final):
+                for name in PROMOTIONS:
+                    moves.append(Move(move.initial, move.final, name))
+            else:
+                moves.append(move)
         return moves
 
+    def legal_move_codes(self, color=None):
+        '''
+        legal_moves as 16 bit packed codes (Move.pack) in an array('H')
+        '''
+        return array('H', [move.pack() for move in self.legal_moves(color)])
+
     def is_checkmate(self, color):
-        if not self.is_in_check(color):
-            return False
-        
-        moves = self.get_all_possible_moves(color)
-        return len(moves) == 0
+        return self.is_in_check(color) and not self.has_legal_move(color)
 
     def is_stalemate(self, color):
-        if self.is_in_check(color):
-            return False
-        
-        moves = self.get_all_possible_moves(color)
-        return len(moves) == 0
+        return not self.is_in_check(color) and not self.has_legal_move(color)
 
-    def check_game_over(self, current_player):
-        if self.is_checkmate(current_player):
+    def check_game_over(self, current_player, fill_cache=False):
+        # the first legal move found settles it, mate or stalemate otherwise.
+        # Mate on the last move before the fifty move limit still counts.
+        # With fill_cache the whole list is generated into move_cache (the
+        # GUI's click on a piece needs it next), without it the search stops
+        # at the first move (self-play and the engine's games)
+        if fill_cache:
+            found = bool(self.get_all_possible_moves(current_player))
+        else:
+            found = self.has_legal_move(current_player)
+        if found:
+            return self.check_draw()
+        if self.is_in_check(current_player):
             # Мат - выигрывает противник
             winner = "black" if current_player == "white" else "white"
             self.game_over = winner
-            return True
-        elif self.is_stalemate(current_player):
+        else:
             # Пат - ничья
             self.game_over = "stalemate"
-            return True
-        return False
+        return True
+
+    def check_draw(self):
+        '''
+        Set game_over to 'repetition' (threefold) or 'fifty' when the
+        position is drawn by rule, O(1) from the hash history
+        '''
+        if self.is_repetition(3):
+            self.game_over = 'repetition'
+        elif self.is_fifty_moves():
+            self.game_over = 'fifty'
+        return bool(self.game_over)
 
     def valid_move(self, piece, move):
-        return move in piece.moves
+        # a piece's moves all start on its square, the targets bitmask decides
+        if not piece.moves or not piece.moves[0].initial == move.initial:
+            return False
+        return piece.targets >> (move.final.row * 8 + move.final.col) & 1 == 1
     
     def set_true_en_passant(self, piece):
         if not isinstance(piece, Pawn):
             return
-        for row in range(ROWS):
-            for col in range(COLS):
-                if isinstance(self.squares[row][col].piece, Pawn):
-                    self.squares[row][col].piece.en_passant = False
+        if self.en_passant_pawn:
+            self.en_passant_pawn.en_passant = False
         piece.en_passant = True
+        self.en_passant_pawn = piece
 
     def set_false_en_passant(self):
         for row in range(ROWS):
@@ -180,263 +849,129 @@ class Board:
                         if self.last_move.final.piece != pawn:
                             pawn.en_passant = False
 
-    def in_check(self, piece, move):
-        # ИСПРАВЛЕНИ: Проверка валидности координат
-        if not Square.inrange(move.initial.row, move.initial.col):
-            return False
-        if not Square.inrange(move.final.row, move.final.col):
-            return False
-        
-        # Специальная обработка для рокировки чтобы избежать рекурсии
-        if isinstance(piece, King) and abs(move.final.col - move.initial.col) == 2:
-            # Для рокировки проверяем только безопасность конечной позиции короля
-            temp_board = copy.deepcopy(self)
-            
-            # Очищаем ссылки на ладьи чтобы избежать проблем с глубоким копированием
-            for row in range(ROWS):
-                for col in range(COLS):
-                    if isinstance(temp_board.squares[row][col].piece, King):
-                        temp_board.squares[row][col].piece.left_rook = None
-                        temp_board.squares[row][col].piece.right_rook = None
-            
-            # Симулируем только перемещение короля на конечную позицию
-            temp_board.squares[move.initial.row][move.initial.col].piece = None
-            temp_board.squares[move.final.row][move.final.col].piece = piece
-            
-            # Проверяем может ли вражеская фигура атаковать новую позицию короля
-            for row in range(ROWS):
-                for col in range(COLS):
-                    if temp_board.squares[row][col].has_enemy_piece(piece.color):
-                        p = temp_board.squares[row][col].piece
-                        temp_board.calc_moves(p, row, col, bool=False)
-                        for m in p.moves:
-                            if m.final.row == move.final.row and m.final.col == move.final.col:
-                                return True
-            return False
-        
-        # Стандартная проверка для обычных ходов
-        temp_piece = copy.deepcopy(piece)
-        temp_board = copy.deepcopy(self)
-        
-        # Очищаем ссылки на ладьи для предотвращения проблем с глубоким копированием
-        if isinstance(temp_piece, King):
-            temp_piece.left_rook = None
-            temp_piece.right_rook = None
-        
-        temp_board.move(temp_piece, move)
-
-        for row in range(ROWS):
-            for col in range(COLS):
-                if temp_board.squares[row][col].has_enemy_piece(piece.color):
-                    p = temp_board.squares[row][col].piece
-                    temp_board.calc_moves(p, row, col, bool=False)
-                    for m in p.moves:
-                        if isinstance(m.final.piece, King):
-                            return True
-        return False
-
     def calc_moves(self, piece, row, col, bool=True):
         '''
-        Calculate all the possible/valid moves on a specific piece on a specific position
+        Calculate all the possible/valid moves on a specific piece on a specific position.
+        With bool the moves are filtered by the check and pin masks of
+        _legality, no move is played to test it
         '''
-        piece.moves = []
-        
+        piece.clear_moves()
+
+        if bool and self.kings[piece.color]:
+            checkers, evasions, pins, xray = self._legality(piece.color)
+            # squares this piece may end on, the king is tested square by square
+            allowed = evasions & pins.get(row * 8 + col, ALL_SQUARES)
+            if not allowed and not isinstance(piece, King):
+                return
+        else:
+            bool = False
+
+        def add(move):
+            # pseudo legal move, kept if the masks allow its target
+            if not bool or allowed >> (move.final.row * 8 + move.final.col) & 1:
+                piece.add_move(move)
+
         def pawn_moves():
             # steps
             steps = 1 if piece.moved else 2
 
             # vertical moves
-            start = row + piece.dir
-            end = row + (piece.dir * (1 + steps))
-            for possible_move_row in range(start, end, piece.dir):
-                if Square.inrange(possible_move_row):
-                    if self.squares[possible_move_row][col].isempty():
-                        # create initial and final move squares 
-                        initial = Square(row, col)
-                        final = Square(possible_move_row, col)
-                        # create a move
-                        move = Move(initial, final)
-
-                        # check potential checks
-                        if bool:
-                            if not self.in_check(piece, move):
-                                # append new move
-                                piece.add_move(move)
-                        else: 
-                            piece.add_move(move)
-                    # we are blocked 
-                    else: break
-                # not in range 
+            for possible_move_row, possible_move_col in PAWN_PUSHES[piece.color][row][col][:steps]:
+                if self.squares[possible_move_row][possible_move_col].isempty():
+                    # create initial and final move squares 
+                    initial = Square(row, col)
+                    final = Square(possible_move_row, possible_move_col)
+                    # create a move
+                    add(Move(initial, final))
+                # we are blocked 
                 else: break
             
             #diagonal moves 
-            possible_move_row = row + piece.dir
-            possible_move_cols = [col-1, col+1]
-            for possible_move_col in possible_move_cols:
-                if Square.inrange(possible_move_row, possible_move_col):
-                    if self.squares[possible_move_row][possible_move_col].has_enemy_piece(piece.color):
+            for possible_move_row, possible_move_col in PAWN_CAPTURES[piece.color][row][col]:
+                if self.squares[possible_move_row][possible_move_col].has_enemy_piece(piece.color):
+                    # create initial and final move squares 
+                    initial = Square(row, col)
+                    final_piece = self.squares[possible_move_row][possible_move_col].piece
+                    final = Square(possible_move_row, possible_move_col, final_piece)
+                    # create a move
+                    add(Move(initial, final))
+
+            # en_passant moves, left and right
+            r = 3 if piece.color == 'white' else 4
+            fr = 2 if piece.color == 'white' else 5
+            if row != r:
+                return
+            for c in (col - 1, col + 1):
+                if Square.inrange(c) and self.squares[row][c].has_enemy_piece(piece.color):
+                    p = self.squares[row][c].piece
+                    if isinstance(p, Pawn) and p.en_passant:
                         # create initial and final move squares 
                         initial = Square(row, col)
-                        final_piece = self.squares[possible_move_row][possible_move_col].piece
-                        final = Square(possible_move_row, possible_move_col, final_piece)
+                        final = Square(fr, c, p)
                         # create a move
                         move = Move(initial, final)
-                        # append new move
                         if bool:
-                            if not self.in_check(piece, move):
-                                # append new move
-                                piece.add_move(move)
-                        else: 
-                            piece.add_move(move)
-
-            # en_passant moves 
-            r = 3 if piece.color == 'white' else 4
-            fr = 2 if piece.color == 'white' else 5
-            # left en_passant 
-            if Square.inrange(col-1) and row == r:
-                if self.squares[row][col-1].has_enemy_piece(piece.color):
-                    p = self.squares[row][col-1].piece
-                    if isinstance(p, Pawn):
-                        if p.en_passant:
-                            # create initial and final move squares 
-                            initial = Square(row, col)
-                            final = Square(fr, col-1, p)
-                            # create a move
-                            move = Move(initial, final)
-                            # append new move
-                            if bool:
-                                if not self.in_check(piece, move):
-                                    # append new move
-                                    piece.add_move(move)
-                            else: 
-                                piece.add_move(move)
-
-            # right en_passant
-            if Square.inrange(col+1) and row == r:
-                if self.squares[row][col+1].has_enemy_piece(piece.color):
-                    p = self.squares[row][col+1].piece
-                    if isinstance(p, Pawn):
-                        if p.en_passant:
-                            # create initial and final move squares 
-                            initial = Square(row, col)
-                            final = Square(fr, col+1, p)
-                            # create a move
-                            move = Move(initial, final)
-                            # append new move
-                            if bool:
-                                if not self.in_check(piece, move):
-                                    # append new move
-                                    piece.add_move(move)
-                            else: 
-                                piece.add_move(move)
+                            # the masks do not cover the taken pawn's square: a knight
+                            # or pawn check stands unless that pawn gave it, and the
+                            # slider lines of the king are looked at after the capture
+                            taken = row * 8 + c
+                            if any(sq != taken and type(self.squares[sq // 8][sq % 8].piece) not in SLIDES
+                                   for sq in checkers):
+                                continue
+                            if self._exposed(piece.color, (row * 8 + col, taken), fr * 8 + c):
+                                continue
+                        piece.add_move(move)
 
         def knight_moves():
-            # 8 possible moves
-            possible_moves = [
-                (row-2, col+1),
-                (row-1, col+2),
-                (row+1, col+2),
-                (row+2, col+1),
-                (row+2, col-1),
-                (row+1, col-2),
-                (row-1, col-2),
-                (row-2, col-1),
-            ]
-            for possible_move in possible_moves:
-                possible_move_row, possible_move_col = possible_move
-
-                if Square.inrange(possible_move_row, possible_move_col):
-                    if self.squares[possible_move_row][possible_move_col].isempty_or_enemy(piece.color):
-                        # create squares of the new move 
-                        initial = Square(row, col)
-                        final_piece = self.squares[possible_move_row][possible_move_col].piece
-                        final = Square(possible_move_row, possible_move_col, final_piece)
-                        # create move 
-                        move = Move(initial, final)
-                        if bool:
-                            if not self.in_check(piece, move):
-                                # append new move
-                                piece.add_move(move)
-                        else: 
-                            piece.add_move(move)
-
-        def straightline_move(incrs):
-            for incr in incrs:
-                row_incr, col_incr = incr
-                possible_move_row = row + row_incr
-                possible_move_col = col + col_incr
-
-                while True:
-                    if Square.inrange(possible_move_row, possible_move_col):
-                        # create squares of the possible new move
-                        initial = Square(row, col)
-                        final_piece = self.squares[possible_move_row][possible_move_col].piece
-                        final = Square(possible_move_row, possible_move_col, final_piece)
-                        # create a possible new move
-                        move = Move(initial, final)
- 
-                        # empty = continue looping
-                        if self.squares[possible_move_row][possible_move_col].isempty():
-                            # append new move
-                            if bool:
-                                if not self.in_check(piece, move):
-                                    # append new move
-                                    piece.add_move(move)
-                            else: 
-                                piece.add_move(move)
-
-                        # has enemy piece = add move + break
-                        elif self.squares[possible_move_row][possible_move_col].has_enemy_piece(piece.color):
-                            # append new move
-                            if bool:
-                                if not self.in_check(piece, move):
-                                    # append new move
-                                    piece.add_move(move)
-                            else: 
-                                piece.add_move(move)
-                            break
+            # up to 8 possible moves
+            for possible_move_row, possible_move_col in KNIGHT_TARGETS[row][col]:
+                if self.squares[possible_move_row][possible_move_col].isempty_or_enemy(piece.color):
+                    # create squares of the new move 
+                    initial = Square(row, col)
+                    final_piece = self.squares[possible_move_row][possible_move_col].piece
+                    final = Square(possible_move_row, possible_move_col, final_piece)
+                    # create move 
+                    add(Move(initial, final))
 
-                        # has team piece = break
-                        elif self.squares[possible_move_row][possible_move_col].has_team_piece(piece.color):
-                            break
+        def straightline_move(rays):
+            for ray in rays:
+                for possible_move_row, possible_move_col in ray:
+                    # create squares of the possible new move
+                    initial = Square(row, col)
+                    final_piece = self.squares[possible_move_row][possible_move_col].piece
+                    final = Square(possible_move_row, possible_move_col, final_piece)
+                    # create a possible new move
+                    move = Move(initial, final)
 
-                    # not in range 
-                    else: break
+                    # empty = continue looping
+                    if final_piece is None:
+                        add(move)
 
-                    # increments
-                    possible_move_row = possible_move_row + row_incr
-                    possible_move_col = possible_move_col + col_incr
+                    # has enemy piece = add move + break
+                    elif final_piece.color != piece.color:
+                        add(move)
+                        break
 
-        def king_moves():
-            adjs = [
-                (row-1,col+0), 
-                (row-1,col+1),
-                (row+0,col+1),
-                (row+1,col+1),
-                (row+1,col+0),
-                (row+1,col-1),
-                (row+0,col-1),
-                (row-1,col-1)
-            ]
+                    # has team piece = break
+                    else:
+                        break
 
+        def king_moves():
+            enemy = 'black' if piece.color == 'white' else 'white'
             # normal moves
-            for possible_move in adjs:
-                possible_move_row, possible_move_col = possible_move
-
-                if Square.inrange(possible_move_row, possible_move_col):
-                    if self.squares[possible_move_row][possible_move_col].isempty_or_enemy(piece.color):
-                        # create initial and final move squares 
-                        initial = Square(row, col)
-                        final = Square(possible_move_row, possible_move_col)
-                        # create a move
-                        move = Move(initial, final)
-                        # append new move
-                        if bool:
-                            if not self.in_check(piece, move):
-                                # append new move
-                                piece.add_move(move)
-                        else: 
-                            piece.add_move(move)
+            for possible_move_row, possible_move_col in KING_TARGETS[row][col]:
+                if self.squares[possible_move_row][possible_move_col].isempty_or_enemy(piece.color):
+                    # the king may not step onto an attacked (or defended) square,
+                    # nor back along the line of a checking slider
+                    if bool:
+                        target = possible_move_row * 8 + possible_move_col
+                        if self.attackers[enemy][target] or xray >> target & 1:
+                            continue
+                    # create initial and final move squares
+                    initial = Square(row, col)
+                    final = Square(possible_move_row, possible_move_col)
+                    # create a move
+                    piece.add_move(Move(initial, final))
 
             # ИСПРАВЛЕННАЯ РОКИРОВКА
             if not piece.moved:
@@ -452,35 +987,17 @@ class Board:
                                 break
                         
                         if can_castle:
-                            # Добавляем ссылку на ладью к королю
-                            piece.left_rook = left_rook
-                            
-                            # Ход ладьи
-                            initial_rook = Square(row, 0)
-                            final_rook = Square(row, 3)
-                            moveR = Move(initial_rook, final_rook)
-                            
                             # Ход короля
                             initial_king = Square(row, col)
                             final_king = Square(row, 2)
                             moveK = Move(initial_king, final_king)
                             
                             # Проверяем безопасность ходов
+                            # король не под шахом и не проходит через битые поля
                             if bool:
-                                try:
-                                    king_safe = not self.in_check(piece, moveK)
-                                    # Также проверяем промежуточную клетку
-                                    intermediate = Square(row, 3)
-                                    move_intermediate = Move(initial_king, intermediate)
-                                    intermediate_safe = not self.in_check(piece, move_intermediate)
-                                    
-                                    if king_safe and intermediate_safe:
-                                        left_rook.add_move(moveR)
-                                        piece.add_move(moveK)
-                                except:
-                                    pass  # Пропускаем если проверка не удалась
+                                if not checkers and not any(self.is_attacked(row, c, enemy) for c in (3, 2)):
+                                    piece.add_move(moveK)
                             else:
-                                left_rook.add_move(moveR)
                                 piece.add_move(moveK)
 
                 # Ферзевый фланг (длинная рокировка)
@@ -495,35 +1012,17 @@ class Board:
                                 break
                         
                         if can_castle:
-                            # Добавляем ссылку на ладью к королю
-                            piece.right_rook = right_rook
-                            
-                            # Ход ладьи
-                            initial_rook = Square(row, 7)
-                            final_rook = Square(row, 5)
-                            moveR = Move(initial_rook, final_rook)
-                            
                             # Ход короля
                             initial_king = Square(row, col)
                             final_king = Square(row, 6)
                             moveK = Move(initial_king, final_king)
                             
                             # Проверяем безопасность ходов
+                            # король не под шахом и не проходит через битые поля
                             if bool:
-                                try:
-                                    king_safe = not self.in_check(piece, moveK)
-                                    # Также проверяем промежуточную клетку
-                                    intermediate = Square(row, 5)
-                                    move_intermediate = Move(initial_king, intermediate)
-                                    intermediate_safe = not self.in_check(piece, move_intermediate)
-                                    
-                                    if king_safe and intermediate_safe:
-                                        right_rook.add_move(moveR)
-                                        piece.add_move(moveK)
-                                except:
-                                    pass  # Пропускаем если проверка не удалась
+                                if not checkers and not any(self.is_attacked(row, c, enemy) for c in (5, 6)):
+                                    piece.add_move(moveK)
                             else:
-                                right_rook.add_move(moveR)
                                 piece.add_move(moveK)
 
         # Выполняем расчёт ходов в зависимости от типа фигуры
@@ -531,23 +1030,10 @@ class Board:
             pawn_moves()
         elif isinstance(piece, Knight): 
             knight_moves()
-        elif isinstance(piece, Bishop): 
-            straightline_move([(-1, 1),(-1, -1),(1, 1),(1,-1)])
-        elif isinstance(piece, Rook): 
-            straightline_move([(-1, 0),(0, 1),(1, 0),(0, -1)])
+        elif isinstance(piece, Bishop) or isinstance(piece, Rook) or isinstance(piece, Queen):
+            straightline_move(SLIDE_RAYS[type(piece)][row][col])
         elif isinstance(piece, King): 
             king_moves()
-        elif isinstance(piece, Queen): 
-            straightline_move([
-                (-1, 1),
-                (-1, -1),
-                (1, 1),
-                (1,-1),
-                (-1, 0),
-                (0, 1),
-                (1, 0),
-                (0, -1)
-            ])
     
     def _create(self):
         for row in range(ROWS):
@@ -0,0 +1,161 @@
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+from collections import defaultdict
+
+from const import *
+from piece import King
+from board import START_FEN
+from bitboard import BACKENDS
+from pgn import read_games
+
+# Polyglot book entries: 16 bytes, big endian, sorted by key
+#   key (8) position key, see zobrist.py
+#   move (2) to file | to rank << 3 | from file << 6 | from rank << 9 | promotion << 12
+#   weight (2), learn (4)
+# ranks count from rank 1, castling is written as the king taking its own rook.
+# The keys are Board.hash, zobrist.py has the Polyglot layout and Random64
+# table, so any Polyglot .bin works as well as the books of build_book.
+ENTRY = struct.Struct('>QHHI')
+KEY = struct.Struct('>Q')
+PROMOTION_PIECES = ['knight', 'bishop', 'rook', 'queen']
+
+
+def encode_move(board, move):
+    '''
+    Polyglot code of a legal move of board
+    '''
+    to_col, to_row = move.final.col, move.final.row
+    piece = board.squares[move.initial.row][move.initial.col].piece
+    if isinstance(piece, King) and abs(to_col - move.initial.col) == 2:
+        to_col = 7 if to_col > move.initial.col else 0
+    code = (to_col | (ROWS - 1 - to_row) << 3 | move.initial.col << 6
+            | (ROWS - 1 - move.initial.row) << 9)
+    if move.promotion:
+        code |= (PROMOTION_PIECES.index(move.promotion) + 1) << 12
+    return code
+
+
+class OpeningBook:
+    '''
+    Polyglot .bin book, memory mapped and binary searched by position
+    key: only the pages around the looked up entries are ever read
+    '''
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.count = size // ENTRY.size
+        # mmap refuses empty files
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else b''
+
+    def close(self):
+        if self.count:
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def entries(self, key):
+        '''
+        (move code, weight) of every entry of a position key
+        '''
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if KEY.unpack_from(self.data, mid * ENTRY.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        found = []
+        for i in range(lo, self.count):
+            entry_key, code, weight, learn = ENTRY.unpack_from(self.data, i * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((code, weight))
+        return found
+
+    def moves(self, board):
+        '''
+        (move, weight) of the book moves of board that are legal there
+        '''
+        entries = self.entries(board.hash)
+        if not entries:
+            return []
+        by_code = {encode_move(board, move): move for move in board.legal_moves()}
+        return [(by_code[code], weight) for code, weight in entries if code in by_code]
+
+    def choose(self, board, best=False, rng=random):
+        '''
+        Book move of board, None when out of book. Picked at random by
+        weight, or the heaviest one with best
+        '''
+        moves = [(move, weight) for move, weight in self.moves(board) if weight > 0]
+        if not moves:
+            return None
+        if best:
+            return max(moves, key=lambda entry: entry[1])[0]
+        return rng.choices([move for move, _ in moves], [weight for _, weight in moves])[0]
+
+
+def build_book(pgn_path, book_path, plies=16, backend='bitboard'):
+    '''
+    Write a book of the first plies moves of the games of a PGN file,
+    weighted by how often they were played. Returns the entry count
+    '''
+    counts = defaultdict(int)
+    for headers, moves in read_games(pgn_path, backend, strict=False):
+        board = BACKENDS[backend].from_fen(headers.get('FEN', START_FEN))
+        for move in moves[:plies]:
+            counts[(board.hash, encode_move(board, move))] += 1
+            board.make_move(move)
+
+    # weights are 16 bits, scale the counts down when they do not fit
+    scale = max(1, (max(counts.values(), default=0) + 0xfffe) // 0xffff)
+    entries = sorted(counts.items(), key=lambda item: (item[0][0], -item[1]))
+    with open(book_path, 'wb') as file:
+        for (key, code), count in entries:
+            file.write(ENTRY.pack(key, code, max(1, count // scale), 0))
+    return len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build or probe a Polyglot opening book')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='book of the openings of a PGN file')
+    build.add_argument('pgn')
+    build.add_argument('book')
+    build.add_argument('--plies', type=int, default=16)
+    probe = commands.add_parser('probe', help='book moves of a position')
+    probe.add_argument('book')
+    probe.add_argument('--fen', default=START_FEN)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        count = build_book(args.pgn, args.book, args.plies)
+        json.dump({'book': args.book, 'entries': count}, sys.stdout, indent=2)
+    else:
+        try:
+            board = BACKENDS['bitboard'].from_fen(args.fen)
+        except ValueError as error:
+            parser.error(str(error))
+        with OpeningBook(args.book) as book:
+            moves = [{'move': move.uci(), 'weight': weight} for move, weight in book.moves(board)]
+        json.dump({'fen': board.to_fen(), 'key': f'{board.hash:016x}', 'moves': moves}, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
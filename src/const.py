@@ -8,3 +8,8 @@ COLS = 8
 ROWS = 8
 SQSIZE = WIDTH // COLS
 
+# render loop
+
+FPS = 60
+# event wait (ms) while an engine is thinking
+ENGINE_POLL = 50
@@ -1,9 +1,9 @@
-import pygame
 from const import *
 
 
 class Dragger:
-    def __init__(self):
+    def __init__(self, textures=None):
+        self.textures = textures
         self.piece = None
         self.dragging = False
         self.mouseX = 0
@@ -12,19 +12,21 @@ class Dragger:
         self.initial_col = 0
 
     def update_blit(self, surface):
-        # texture 
-        self.piece.set_texture(size=128)
-        texture = self.piece.texture
-
-        #image
-        img = pygame.image.load(texture)
+        # image (cached)
+        img = self.textures.piece(self.piece, size=128)
 
         # rectangle
         img_center = (self.mouseX, self.mouseY)
-        self.piece.texture_rect = img.get_rect(center=img_center)
         # blit
-        surface.blit(img, self.piece.texture_rect)
+        surface.blit(img, img.get_rect(center=img_center))
+
 
+    def rect(self):
+        # screen area the dragged piece covers, None when not dragging
+        if not self.dragging:
+            return None
+        img = self.textures.piece(self.piece, size=128)
+        return img.get_rect(center=(self.mouseX, self.mouseY))
 
     def update_mouse(self, pos):
         self.mouseX,self.mouseY = pos # (x, y coordinates)
@@ -0,0 +1,118 @@
+import numpy as np
+
+from const import *
+from square import Square
+from move import Move
+import zobrist
+
+# Position planes, rows and cols as on Board.squares (row 0 is rank 8):
+#  0-5   white pawn, knight, bishop, rook, queen, king
+#  6-11  black pieces in the same order
+#  12    side to move, all ones when white is to move
+#  13-16 castling rights K, Q, k, q, all ones while the right is kept
+#  17    en passant target square
+PLANES = 18
+SIDE_PLANE = 12
+CASTLING_PLANE = 13
+EN_PASSANT_PLANE = 17
+CASTLING_BITS = [zobrist.WHITE_SHORT, zobrist.WHITE_LONG, zobrist.BLACK_SHORT, zobrist.BLACK_LONG]
+
+# Board.pack nibble code of every piece plane
+PLANE_CODES = np.array([1, 2, 3, 4, 5, 6, 9, 10, 11, 12, 13, 14], dtype=np.uint8)
+
+# Policy indices: from * 64 + to for every move (pawns reaching the last
+# rank mean a queen), then the under promotions by side, from file,
+# direction (capture left, push, capture right) and piece
+UNDER_PROMOTIONS = ['rook', 'bishop', 'knight']
+POLICY_SIZE = 64 * 64 + 2 * 8 * 3 * len(UNDER_PROMOTIONS)
+
+
+def move_index(move):
+    '''
+    Policy index of a move
+    '''
+    initial, final = move.initial, move.final
+    if move.promotion and move.promotion != 'queen':
+        side = 0 if final.row == 0 else 1
+        direction = final.col - initial.col + 1
+        return (64 * 64 + ((side * 8 + initial.col) * 3 + direction) * len(UNDER_PROMOTIONS)
+                + UNDER_PROMOTIONS.index(move.promotion))
+    return (initial.row * 8 + initial.col) * 64 + final.row * 8 + final.col
+
+
+def index_move(index, board=None):
+    '''
+    Move of a policy index. With a board, pawn moves to the last rank
+    get their queen promotion
+    '''
+    if index >= 64 * 64:
+        index -= 64 * 64
+        rest, piece = divmod(index, len(UNDER_PROMOTIONS))
+        rest, direction = divmod(rest, 3)
+        side, col = divmod(rest, 8)
+        initial = Square(1 if side == 0 else 6, col)
+        final = Square(0 if side == 0 else 7, col + direction - 1)
+        return Move(initial, final, UNDER_PROMOTIONS[piece])
+    initial, final = divmod(index, 64)
+    move = Move(Square(initial // 8, initial % 8), Square(final // 8, final % 8))
+    if board is not None and final // 8 in (0, 7):
+        piece = board.squares[initial // 8][initial % 8].piece
+        if piece is not None and piece.name == 'pawn':
+            move.promotion = 'queen'
+    return move
+
+
+def legal_mask(board, out=None):
+    '''
+    Boolean (POLICY_SIZE,) mask of the legal moves of the side to move
+    '''
+    if out is None:
+        out = np.zeros(POLICY_SIZE, dtype=bool)
+    else:
+        out[:] = False
+    out[[move_index(move) for move in board.legal_moves()]] = True
+    return out
+
+
+def encode(boards, out=None, dtype=np.float32):
+    '''
+    (N, PLANES, 8, 8) array of a list of boards. out, if given, is a
+    preallocated buffer of at least N positions that is filled in place.
+    Bitboard boards are unpacked straight from their bitboards, other
+    backends from the piece codes the board keeps per square
+    '''
+    n = len(boards)
+    if out is None:
+        out = np.zeros((n, PLANES, ROWS, COLS), dtype=dtype)
+    view = out[:n]
+    view[:] = 0
+    if not n:
+        return out
+
+    if all(hasattr(board, 'pieces') for board in boards):
+        # 12 bitboards per position, bit sq is square row * 8 + col
+        words = np.array([board.pieces[0] + board.pieces[1] for board in boards], dtype='<u8')
+        bits = np.unpackbits(words.view(np.uint8).reshape(n, 12, 8), axis=-1, bitorder='little')
+        view[:, :12] = bits.reshape(n, 12, ROWS, COLS)
+    else:
+        codes = np.frombuffer(b''.join(board.codes for board in boards), dtype=np.uint8).reshape(n, 64)
+        planes = codes[:, None, :] == PLANE_CODES[None, :, None]
+        view[:, :12] = planes.reshape(n, 12, ROWS, COLS)
+
+    side = np.array([board.next_player == 'white' for board in boards])
+    view[:, SIDE_PLANE] = side[:, None, None]
+    castling = np.array([board.castling for board in boards])
+    for i, bit in enumerate(CASTLING_BITS):
+        view[:, CASTLING_PLANE + i] = (castling & bit != 0)[:, None, None]
+    for i, board in enumerate(boards):
+        target = board.en_passant_square()
+        if target:
+            view[i, EN_PASSANT_PLANE, target[0], target[1]] = 1
+    return out
+
+
+def encode_board(board, dtype=np.float32):
+    '''
+    (PLANES, 8, 8) array of one board
+    '''
+    return encode([board], dtype=dtype)[0]
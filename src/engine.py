@@ -0,0 +1,293 @@
+import time
+
+from piece import *
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+from evaluation import evaluate
+
+# scores are centipawns from the side to move's point of view
+MATE = 30000
+INFINITY = 32000
+MAX_PLY = 64
+
+# piece values for move ordering (most valuable victim, least valuable attacker)
+ORDER_VALUES = {'pawn': 100, 'knight': 300, 'bishop': 300, 'rook': 500, 'queen': 900, 'king': 2000}
+
+
+class SearchAborted(Exception):
+    pass
+
+
+class SearchResult:
+    def __init__(self, best_move, pv, score, depth, nodes, seconds):
+        self.best_move = best_move
+        self.pv = pv  # principal variation, a list of moves
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.seconds = seconds
+        self.nps = int(nodes / seconds) if seconds > 0 else nodes
+
+    def is_mate(self):
+        return abs(self.score) >= MATE - MAX_PLY
+
+
+class Engine:
+    '''
+    Negamax alpha-beta search with iterative deepening, quiescence search
+    on captures, transposition table, MVV-LVA/killer/history move
+    ordering and a hard time, node and stop budget. The board is searched
+    in place with make_move/unmake_move and left as it was found.
+    '''
+
+    def __init__(self, time_limit=1.0, max_depth=MAX_PLY, max_nodes=None, tt_megabytes=16,
+                 book=None, book_best=False, tablebases=None):
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.tt = TranspositionTable(tt_megabytes)
+        self.book = book  # book.OpeningBook asked before searching
+        self.book_best = book_best  # heaviest book move instead of a weighted pick
+        self.tablebases = tablebases  # tablebase.Tablebases, played without search
+        # root alpha per depth shared by the workers of a parallel search, see parallel.py
+        self.shared_bounds = None
+        self.stopped = False
+        self.nodes = 0
+
+    def stop(self):
+        # may be called from another thread, the search unwinds at the next node
+        self.stopped = True
+
+    def search(self, board, time_limit=None, max_depth=None, max_nodes=None, infinite=False,
+               on_info=None, root_moves=None):
+        '''
+        Search the side to move's best move. Returns the result of the
+        deepest completed iteration, on_info is called after each one.
+        root_moves (UCI strings) limits the moves searched at the root
+        '''
+        time_limit = time_limit if time_limit is not None else self.time_limit
+        max_depth = min(max_depth or self.max_depth, MAX_PLY)
+        self.max_nodes_now = max_nodes or self.max_nodes
+        self.stopped = False
+        self.nodes = 0
+        self.start = time.perf_counter()
+        self.deadline = None if infinite or not time_limit else self.start + time_limit
+        self.killers = [[None, None] for ply in range(MAX_PLY + 2)]
+        self.history = {}
+        self.pv = [[] for ply in range(MAX_PLY + 2)]
+        self.tt.new_search()
+
+        moves = board.legal_moves()
+        if root_moves is not None:
+            moves = [move for move in moves if move.uci() in root_moves]
+        self.root_moves = moves if root_moves is not None else None
+        if not moves:
+            score = -MATE if board.is_in_check(board.next_player) else 0
+            return SearchResult(None, [], score, 0, 0, 0)
+        if self.book is not None and root_moves is None:
+            move = self.book.choose(board, self.book_best)
+            if move is not None:
+                return SearchResult(move, [move], 0, 0, 0, time.perf_counter() - self.start)
+        if self.tablebases is not None and root_moves is None:
+            found = self.tablebases.best_move(board)
+            if found is not None:
+                move, outcome, plies = found
+                score = {'win': MATE - (plies or 0), 'loss': -MATE + (plies or 0), 'draw': 0}[outcome]
+                return SearchResult(move, [move], score, 0, 0, time.perf_counter() - self.start)
+
+        result = None
+        for depth in range(1, max_depth + 1):
+            self.iteration = depth
+            try:
+                score = self._negamax(board, depth, -INFINITY, INFINITY, 0)
+            except SearchAborted:
+                break
+            pv = list(self.pv[0])
+            seconds = time.perf_counter() - self.start
+            result = SearchResult(pv[0] if pv else moves[0], pv, score, depth, self.nodes, seconds)
+            if on_info:
+                on_info(result)
+            if result.is_mate() and not infinite:
+                break
+            # the next iteration would not finish in the time left
+            if self.deadline and time.perf_counter() - self.start > (self.deadline - self.start) / 2:
+                break
+
+        seconds = time.perf_counter() - self.start
+        if result is None:
+            return SearchResult(moves[0], [moves[0]], 0, 0, self.nodes, seconds)
+        result.nodes = self.nodes
+        result.seconds = seconds
+        result.nps = int(self.nodes / seconds) if seconds > 0 else self.nodes
+        return result
+
+    def _tick(self):
+        self.nodes += 1
+        if self.stopped:
+            raise SearchAborted
+        if self.nodes & 255 == 0:
+            if self.deadline and time.perf_counter() >= self.deadline:
+                raise SearchAborted
+        if self.max_nodes_now and self.nodes >= self.max_nodes_now:
+            raise SearchAborted
+
+    def _negamax(self, board, depth, alpha, beta, ply):
+        self.pv[ply] = []
+        # a position seen before on the board's history (or the fifty move
+        # rule) ends the line as a draw
+        if ply > 0 and (board.is_repetition(2) or board.is_fifty_moves()):
+            return 0
+        color = board.next_player
+        in_check = board.is_in_check(color)
+        # check extension
+        if in_check:
+            depth += 1
+        if depth <= 0:
+            return self._quiesce(board, alpha, beta, ply)
+        self._tick()
+
+        key = board.hash
+        tt_move = None
+        entry = self.tt.probe(key)
+        if entry:
+            entry_depth, value, flag, tt_move = entry
+            if ply > 0 and entry_depth >= depth:
+                value = self._from_tt(value, ply)
+                if (flag == EXACT or (flag == LOWER and value >= beta)
+                        or (flag == UPPER and value <= alpha)):
+                    return value
+
+        moves = self.root_moves if ply == 0 and self.root_moves is not None else board.legal_moves(color)
+        if not moves:
+            return -MATE + ply if in_check else 0
+        if ply >= MAX_PLY:
+            return evaluate(board)
+
+        alpha_orig = alpha
+        best, best_move = -INFINITY, None
+        for move in self._order(board, moves, tt_move, ply):
+            if ply == 0 and self.shared_bounds is not None:
+                # another worker already has a better root move, ours only
+                # have to be proven worse and our line is no candidate
+                shared = self.shared_bounds[self.iteration]
+                if shared > alpha:
+                    alpha = alpha_orig = shared
+                    self.pv[0] = []
+            quiet = not self._victim(board, move) and not move.promotion
+            token = board.make_move(move)
+            try:
+                score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                board.unmake_move(token)
+
+            if score > best:
+                best, best_move = score, move
+            if score > alpha:
+                alpha = score
+                self.pv[ply] = [move] + self.pv[ply + 1]
+                if ply == 0 and self.shared_bounds is not None:
+                    self._share(score)
+                if alpha >= beta:
+                    if quiet:
+                        self._remember_cutoff(move, depth, ply)
+                    break
+
+        if best <= alpha_orig:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.store(key, depth, self._to_tt(best, ply), flag, best_move.pack())
+        return best
+
+    def _quiesce(self, board, alpha, beta, ply):
+        self._tick()
+        self.pv[ply] = []
+        stand_pat = evaluate(board)
+        if stand_pat >= beta or ply >= MAX_PLY:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        captures = [move for move in board.legal_moves() if self._victim(board, move)]
+        captures.sort(key=lambda move: self._mvv_lva(board, move), reverse=True)
+        for move in captures:
+            token = board.make_move(move)
+            try:
+                score = -self._quiesce(board, -beta, -alpha, ply + 1)
+            finally:
+                board.unmake_move(token)
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+                self.pv[ply] = [move] + self.pv[ply + 1]
+        return alpha
+
+    def _share(self, score):
+        bounds = self.shared_bounds
+        with bounds.get_lock():
+            if score > bounds[self.iteration]:
+                bounds[self.iteration] = score
+
+    # move ordering
+
+    def _victim(self, board, move):
+        '''
+        Piece captured by move, None for quiet moves
+        '''
+        victim = board.squares[move.final.row][move.final.col].piece
+        if victim:
+            return victim
+        piece = board.squares[move.initial.row][move.initial.col].piece
+        if isinstance(piece, Pawn) and move.initial.col != move.final.col:
+            return board.squares[move.initial.row][move.final.col].piece
+        return None
+
+    def _mvv_lva(self, board, move):
+        victim = self._victim(board, move)
+        attacker = board.squares[move.initial.row][move.initial.col].piece
+        return 10 * ORDER_VALUES[victim.name] - ORDER_VALUES[attacker.name]
+
+    def _order(self, board, moves, tt_move, ply):
+        killers = self.killers[ply]
+
+        def score(move):
+            key = move.pack()
+            if key == tt_move:
+                return 1000000
+            if self._victim(board, move):
+                return 100000 + self._mvv_lva(board, move)
+            if move.promotion:
+                return 90000 + ORDER_VALUES[move.promotion]
+            if key == killers[0]:
+                return 80000
+            if key == killers[1]:
+                return 79000
+            return self.history.get(key, 0)
+
+        return sorted(moves, key=score, reverse=True)
+
+    def _remember_cutoff(self, move, depth, ply):
+        key = move.pack()
+        killers = self.killers[ply]
+        if killers[0] != key:
+            killers[1] = killers[0]
+            killers[0] = key
+        self.history[key] = min(self.history.get(key, 0) + depth * depth, 70000)
+
+    # mate scores are stored relative to the node, not the root
+
+    def _to_tt(self, score, ply):
+        if score >= MATE - MAX_PLY:
+            return score + ply
+        if score <= -MATE + MAX_PLY:
+            return score - ply
+        return score
+
+    def _from_tt(self, score, ply):
+        if score >= MATE - MAX_PLY:
+            return score - ply
+        if score <= -MATE + MAX_PLY:
+            return score + ply
+        return score
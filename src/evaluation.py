@@ -0,0 +1,190 @@
+import argparse
+import json
+import sys
+
+# Material and piece-square tables, tapered between middlegame (mg) and
+# endgame (eg) by the phase, the weight of the pieces left on the board.
+# The board keeps the running mg/eg sums and the phase up to date in
+# Board._place/_lift, so evaluating a position is O(1).
+
+MATERIAL = {
+    'pawn': (82, 94), 'knight': (337, 281), 'bishop': (365, 297),
+    'rook': (477, 512), 'queen': (1025, 936), 'king': (0, 0),
+}
+PHASES = {'pawn': 0, 'knight': 1, 'bishop': 1, 'rook': 2, 'queen': 4, 'king': 0}
+MAX_PHASE = 24  # phase of the start position
+
+# tables from white's side, rows as on Board.squares (row 0 is rank 8)
+PAWN_MG = [
+     0,   0,   0,   0,   0,   0,   0,   0,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    10,  10,  20,  30,  30,  20,  10,  10,
+     5,   5,  10,  25,  25,  10,   5,   5,
+     0,   0,   0,  20,  20,   0,   0,   0,
+     5,  -5, -10,   0,   0, -10,  -5,   5,
+     5,  10,  10, -20, -20,  10,  10,   5,
+     0,   0,   0,   0,   0,   0,   0,   0,
+]
+PAWN_EG = [
+     0,   0,   0,   0,   0,   0,   0,   0,
+    80,  80,  80,  80,  80,  80,  80,  80,
+    50,  50,  50,  50,  50,  50,  50,  50,
+    30,  30,  30,  30,  30,  30,  30,  30,
+    20,  20,  20,  20,  20,  20,  20,  20,
+    10,  10,  10,  10,  10,  10,  10,  10,
+    10,  10,  10,  10,  10,  10,  10,  10,
+     0,   0,   0,   0,   0,   0,   0,   0,
+]
+KNIGHT = [
+   -50, -40, -30, -30, -30, -30, -40, -50,
+   -40, -20,   0,   0,   0,   0, -20, -40,
+   -30,   0,  10,  15,  15,  10,   0, -30,
+   -30,   5,  15,  20,  20,  15,   5, -30,
+   -30,   0,  15,  20,  20,  15,   0, -30,
+   -30,   5,  10,  15,  15,  10,   5, -30,
+   -40, -20,   0,   5,   5,   0, -20, -40,
+   -50, -40, -30, -30, -30, -30, -40, -50,
+]
+BISHOP = [
+   -20, -10, -10, -10, -10, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,  10,  10,   5,   0, -10,
+   -10,   5,   5,  10,  10,   5,   5, -10,
+   -10,   0,  10,  10,  10,  10,   0, -10,
+   -10,  10,  10,  10,  10,  10,  10, -10,
+   -10,   5,   0,   0,   0,   0,   5, -10,
+   -20, -10, -10, -10, -10, -10, -10, -20,
+]
+ROOK = [
+     0,   0,   0,   0,   0,   0,   0,   0,
+     5,  10,  10,  10,  10,  10,  10,   5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+    -5,   0,   0,   0,   0,   0,   0,  -5,
+     0,   0,   0,   5,   5,   0,   0,   0,
+]
+QUEEN = [
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+   -10,   0,   0,   0,   0,   0,   0, -10,
+   -10,   0,   5,   5,   5,   5,   0, -10,
+    -5,   0,   5,   5,   5,   5,   0,  -5,
+     0,   0,   5,   5,   5,   5,   0,  -5,
+   -10,   5,   5,   5,   5,   5,   0, -10,
+   -10,   0,   5,   0,   0,   0,   0, -10,
+   -20, -10, -10,  -5,  -5, -10, -10, -20,
+]
+KING_MG = [
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -30, -40, -40, -50, -50, -40, -40, -30,
+   -20, -30, -30, -40, -40, -30, -30, -20,
+   -10, -20, -20, -20, -20, -20, -20, -10,
+    20,  20,   0,   0,   0,   0,  20,  20,
+    20,  30,  10,   0,   0,  10,  30,  20,
+]
+KING_EG = [
+   -50, -40, -30, -20, -20, -30, -40, -50,
+   -30, -20, -10,   0,   0, -10, -20, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  30,  40,  40,  30, -10, -30,
+   -30, -10,  20,  30,  30,  20, -10, -30,
+   -30, -30,   0,   0,   0,   0, -30, -30,
+   -50, -30, -30, -30, -30, -30, -30, -50,
+]
+TABLES = {
+    'pawn': (PAWN_MG, PAWN_EG), 'knight': (KNIGHT, KNIGHT), 'bishop': (BISHOP, BISHOP),
+    'rook': (ROOK, ROOK), 'queen': (QUEEN, QUEEN), 'king': (KING_MG, KING_EG),
+}
+
+# PIECE_SQUARE[(name, color)][row * 8 + col] = (mg, eg), material
+# included and signed: white adds, black subtracts (mirrored tables)
+PIECE_SQUARE = {}
+for _name, (_mg, _eg) in TABLES.items():
+    _mg_value, _eg_value = MATERIAL[_name]
+    PIECE_SQUARE[(_name, 'white')] = [(_mg_value + _mg[sq], _eg_value + _eg[sq]) for sq in range(64)]
+    PIECE_SQUARE[(_name, 'black')] = [
+        (-_mg_value - _mg[(7 - sq // 8) * 8 + sq % 8], -_eg_value - _eg[(7 - sq // 8) * 8 + sq % 8])
+        for sq in range(64)
+    ]
+
+FEN_NAMES = {'p': 'pawn', 'n': 'knight', 'b': 'bishop', 'r': 'rook', 'q': 'queen', 'k': 'king'}
+
+
+def taper(mg, eg, phase, white_to_move):
+    '''
+    Blend of the white minus black mg/eg sums by phase, in centipawns
+    for the side to move
+    '''
+    phase = min(phase, MAX_PHASE)
+    score = int((mg * phase + eg * (MAX_PHASE - phase)) / MAX_PHASE)
+    return score if white_to_move else -score
+
+
+def evaluate(board):
+    '''
+    Score of board in centipawns for the side to move, from the sums
+    the board keeps up to date
+    '''
+    return taper(board.mg_score, board.eg_score, board.phase, board.next_player == 'white')
+
+
+def evaluate_fen(fen):
+    '''
+    Score of a FEN (or EPD) position for the side to move, read off the
+    placement without setting up a board
+    '''
+    fields = fen.split()
+    if len(fields) < 2 or fields[1] not in ('w', 'b'):
+        raise ValueError(f'bad FEN {fen!r}')
+    mg = eg = phase = 0
+    row, col = 0, 0
+    for char in fields[0]:
+        if char == '/':
+            row, col = row + 1, 0
+        elif char.isdigit():
+            col += int(char)
+        elif char.lower() in FEN_NAMES and row < 8 and col < 8:
+            name = FEN_NAMES[char.lower()]
+            square_mg, square_eg = PIECE_SQUARE[(name, 'white' if char.isupper() else 'black')][row * 8 + col]
+            mg += square_mg
+            eg += square_eg
+            phase += PHASES[name]
+            col += 1
+        else:
+            raise ValueError(f'bad FEN {fen!r}')
+    return taper(mg, eg, phase, fields[1] == 'w')
+
+
+def evaluate_many(positions):
+    '''
+    Scores of many positions, boards or FEN strings, for offline scoring
+    of position files
+    '''
+    return [evaluate_fen(position) if isinstance(position, str) else evaluate(position)
+            for position in positions]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score the positions of a FEN/EPD file, one per line')
+    parser.add_argument('path')
+    args = parser.parse_args(argv)
+
+    with open(args.path, encoding='utf-8') as file:
+        for line in file:
+            fen = line.strip()
+            if not fen or fen.startswith('#'):
+                continue
+            try:
+                score = evaluate_fen(fen)
+            except ValueError as error:
+                parser.error(str(error))
+            print(json.dumps({'fen': fen, 'score': score}))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
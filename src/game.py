@@ -1,27 +1,44 @@
 import pygame
+import copy
+import threading
 from const import *
-from board import Board
+from bitboard import BACKENDS
 from dragger import Dragger
+from square import Square
+from move import Move
 
 class Game:
-    def __init__(self):
+    def __init__(self, backend='grid', engines=None, textures=None):
         self.next_player = "white"
         self.hovered_sqr = None
-        self.board = Board() 
-        self.dragger = Dragger()
+        self.backend = backend
+        self.board = BACKENDS[backend]()
+        self.textures = textures  # TextureCache shared by all frames
+        self.dragger = Dragger(textures)
+        self.background = None  # pre-rendered board squares
         self.promotion_menu = False
+        self.engines = engines or {}  # color -> Engine playing it
+        self.search_thread = None
+        self.search_job = None
+
+    def render_bg(self):
+        # the board never changes, render it once
+        if self.background is None:
+            self.background = pygame.Surface((WIDTH, HIGHT))
+            for row in range(ROWS):
+                for col in range(COLS):
+                    if (row + col) % 2 == 0:
+                        color = (234, 235, 200) # light green
+                    else:
+                        color = (119, 154, 88) # dark green
+
+                    rect = (col * SQSIZE, row * SQSIZE, SQSIZE, SQSIZE)
+
+                    pygame.draw.rect(self.background, color, rect)
+        return self.background
 
     def show_bg(self, surface):  # this is going to be a show methods
-        for row in range(ROWS):
-            for col in range(COLS):
-                if (row + col) % 2 == 0:
-                    color = (234, 235, 200) # light green
-                else:
-                    color = (119, 154, 88) # dark green
-                
-                rect = (col * SQSIZE, row * SQSIZE, SQSIZE, SQSIZE)
-
-                pygame.draw.rect(surface, color, rect)
+        surface.blit(self.render_bg(), (0, 0))
 
     def show_pieces(self, surface):
         for row in range(ROWS):
@@ -31,11 +48,9 @@ class Game:
 
                     # all except dragging piece
                     if piece is not self.dragger.piece:
-                        piece.set_texture(size=80)
-                        img = pygame.image.load(piece.texture)
+                        img = self.textures.piece(piece, size=80)
                         img_center = col * SQSIZE + SQSIZE // 2, row * SQSIZE + SQSIZE // 2
-                        piece.texture_rect = img.get_rect(center=img_center)
-                        surface.blit(img, piece.texture_rect)
+                        surface.blit(img, img.get_rect(center=img_center))
 
     def show_moves(self, surface):
         if self.dragger.dragging:
@@ -72,6 +87,54 @@ class Game:
             # blit
             pygame.draw.rect(surface, color, rect, width=3)
 
+    # partial redraws
+
+    def square_state(self, row, col):
+        '''
+        Everything drawn on a square, a square needs repainting when
+        this changes
+        '''
+        piece = self.board.squares[row][col].piece
+        if piece is self.dragger.piece:
+            piece = None
+        last = self.board.last_move
+        highlighted = bool(last) and (row, col) in (
+            (last.initial.row, last.initial.col), (last.final.row, last.final.col))
+        target = self.dragger.dragging and any(
+            move.final.row == row and move.final.col == col for move in self.dragger.piece.moves)
+        hovered = self.hovered_sqr is not None and (self.hovered_sqr.row, self.hovered_sqr.col) == (row, col)
+        return piece, highlighted, target, hovered
+
+    def show_square(self, surface, row, col):
+        '''
+        Repaint one square with the same layers as a full redraw,
+        returns the rect to update
+        '''
+        piece, highlighted, target, hovered = self.square_state(row, col)
+        rect = pygame.Rect(col * SQSIZE, row * SQSIZE, SQSIZE, SQSIZE)
+        surface.blit(self.render_bg(), rect, rect)
+        if highlighted:
+            color = (244,247,116) if (row + col) % 2 == 0 else (172,195,51)
+            pygame.draw.rect(surface, color, rect)
+        if target:
+            color = '#C86464' if (row + col) % 2 == 0 else '#844646'
+            pygame.draw.rect(surface, color, rect)
+        if piece:
+            img = self.textures.piece(piece, size=80)
+            surface.blit(img, img.get_rect(center=rect.center))
+        if hovered:
+            pygame.draw.rect(surface, (180,180,180), rect, width=3)
+        return rect
+
+    def squares_under(self, rect):
+        '''
+        (row, col) of every square a screen rect overlaps
+        '''
+        first_row, last_row = max(rect.top // SQSIZE, 0), min((rect.bottom - 1) // SQSIZE, ROWS - 1)
+        first_col, last_col = max(rect.left // SQSIZE, 0), min((rect.right - 1) // SQSIZE, COLS - 1)
+        return [(row, col) for row in range(first_row, last_row + 1)
+                for col in range(first_col, last_col + 1)]
+
     def show_promotion_menu(self, surface):
         """menu for choice in pawn promotion"""
         if not self.board.promotion_pending:
@@ -113,19 +176,12 @@ class Game:
             pygame.draw.rect(surface, (255, 255, 255), (x, y, piece_size, piece_size))
             pygame.draw.rect(surface, (0, 0, 0), (x, y, piece_size, piece_size), 2)
 
-            try:
-                piece_image_path = f'assets/images/imgs-80px/{color}_{piece_name}.png'
-                piece_img = pygame.image.load(piece_image_path)
-                img_rect = piece_img.get_rect(center=(x + piece_size // 2, y + piece_size // 2))
-                surface.blit(piece_img, img_rect)
-            except pygame.error:
-                font_small = pygame.font.Font(None, 24)
-                text = font_small.render(piece_name[0].upper(), True, (0, 0, 0))
-                text_rect = text.get_rect(center=(x + piece_size // 2, y + piece_size // 2))
-                surface.blit(text, text_rect)
+            piece_img = self.textures.get(color, piece_name, size=80)
+            img_rect = piece_img.get_rect(center=(x + piece_size // 2, y + piece_size // 2))
+            surface.blit(piece_img, img_rect)
 
     def show_game_over_menu(self, surface):
-        """Меню окончания игры (мат/пат)"""
+        """Меню окончания игры (мат/пат/ничья)"""
         if not self.board.game_over:
             return
 
@@ -153,6 +209,14 @@ class Game:
             title_text = "ПАТ!"
             subtitle_text = "Ничья"
             title_color = (255, 165, 0)  # Оранжевый для пата
+        elif self.board.game_over == "repetition":
+            title_text = "НИЧЬЯ"
+            subtitle_text = "Троекратное повторение позиции"
+            title_color = (255, 165, 0)
+        elif self.board.game_over == "fifty":
+            title_text = "НИЧЬЯ"
+            subtitle_text = "Правило 50 ходов"
+            title_color = (255, 165, 0)
         else:
             winner = "Белые" if self.board.game_over == "white" else "Чёрные"
             title_text = "ШАХМАТ И МАТ!"
@@ -208,5 +272,55 @@ class Game:
     def set_hover(self, row, col):
         self.hovered_sqr = self.board.squares[row][col]
 
+    # engine players
+
+    def set_engine(self, color, engine):
+        self.engines[color] = engine
+
+    def engine_to_move(self):
+        return (self.next_player in self.engines and not self.board.game_over
+                and not self.board.promotion_pending)
+
+    def update_engine(self):
+        '''
+        Start a search in the background when an engine is to move and
+        play its move once the search is done. Returns True if a move
+        was played
+        '''
+        if self.search_thread is None:
+            if self.engine_to_move():
+                engine = self.engines[self.next_player]
+                # search a copy so the board on screen never changes mid search
+                board = copy.deepcopy(self.board)
+                job = self.search_job = {}
+
+                def think():
+                    job['result'] = engine.search(board)
+
+                self.search_thread = threading.Thread(target=think, daemon=True)
+                self.search_thread.start()
+            return False
+
+        if self.search_thread.is_alive():
+            return False
+        self.search_thread = None
+        result = self.search_job.get('result')
+        if not result or not result.best_move:
+            return False
+
+        best = result.best_move
+        initial = Square(best.initial.row, best.initial.col)
+        final = Square(best.final.row, best.final.col)
+        piece = self.board.squares[initial.row][initial.col].piece
+        if self.board.move(piece, Move(initial, final)):
+            self.board.promote_pawn(best.promotion or 'queen')
+        self.next_turn()
+        self.board.check_game_over(self.next_player, fill_cache=True)
+        return True
+
     def reset(self):
-        self.__init__()
\ No newline at end of file
+        if self.search_thread:
+            for engine in self.engines.values():
+                engine.stop()
+            self.search_thread.join()
+        self.__init__(self.backend, self.engines, self.textures)
\ No newline at end of file
@@ -1,27 +1,52 @@
 import pygame
 import sys
+import argparse
 
 from const import *
 from game import Game
+from bitboard import BACKENDS
+from engine import Engine
+from book import OpeningBook
+from tablebase import Tablebases
+from texture import TextureCache
+from pgn import append_game
 from square import Square
 from move import Move
 
 class Main:
 
-    def __init__(self):
+    def __init__(self, backend='grid', engines=None, fps=FPS, pgn=None):
         pygame.init()
         self.screen = pygame.display.set_mode((WIDTH, HIGHT))
         pygame.display.set_caption("Chess")
-        self.game = Game()
-
-    def mainloop(self):
+        # piece images are loaded once, convert_alpha needs the display
+        self.textures = TextureCache()
+        self.game = Game(backend, engines, self.textures)
+        self.clock = pygame.time.Clock()
+        self.fps = fps
+        self.drawn = None  # square states on screen, None forces a full redraw
+        self.overlay = None
+        self.drag_rect = None
+        self.pgn = pgn  # file the finished games are appended to
+
+    def save_game(self):
+        if self.pgn and self.game.board.move_stack:
+            append_game(self.pgn, self.game)
+
+    def render(self):
+        '''
+        Repaint only the squares whose content changed since the last
+        frame plus the dragged piece's old and new bounds, and update
+        just those rects of the display
+        '''
         game = self.game
         screen = self.screen
-        board = self.game.board 
-        dragger = self.game.dragger
+        board = game.board
+        dragger = game.dragger
+        overlay = (bool(board.promotion_pending), board.game_over)
 
-        while True:
-            # show methods 
+        if self.drawn is None or overlay != self.overlay:
+            # show methods
             game.show_bg(screen)
             game.show_last_move(screen)
             game.show_moves(screen)
@@ -39,7 +64,56 @@ class Main:
             if board.game_over:
                 game.show_game_over_menu(screen)
 
-            for event in pygame.event.get():
+            self.drawn = [[game.square_state(row, col) for col in range(COLS)] for row in range(ROWS)]
+            self.overlay = overlay
+            self.drag_rect = dragger.rect()
+            pygame.display.update()
+            return
+
+        # the menus are static until they go away
+        if any(overlay):
+            return
+
+        dirty = set()
+        for row in range(ROWS):
+            for col in range(COLS):
+                state = game.square_state(row, col)
+                if state != self.drawn[row][col]:
+                    self.drawn[row][col] = state
+                    dirty.add((row, col))
+
+        drag_rect = dragger.rect()
+        for rect in (self.drag_rect, drag_rect):
+            if rect:
+                dirty.update(game.squares_under(rect))
+        self.drag_rect = drag_rect
+
+        rects = [game.show_square(screen, row, col) for row, col in dirty]
+        if dragger.dragging:
+            dragger.update_blit(screen)
+        if rects:
+            pygame.display.update(rects)
+
+    def mainloop(self):
+        game = self.game
+        board = self.game.board 
+        dragger = self.game.dragger
+
+        while True:
+            # engine moves are searched in the background
+            game.update_engine()
+
+            self.render()
+            self.clock.tick(self.fps)
+
+            # sleep until something happens, poll while an engine is thinking
+            if game.search_thread or game.engine_to_move():
+                events = [pygame.event.wait(ENGINE_POLL)]
+            else:
+                events = [pygame.event.wait()]
+            events += pygame.event.get()
+
+            for event in events:
                 # click
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     # ignore clicks if game is over
@@ -52,7 +126,7 @@ class Main:
                         if selected_piece:
                             board.promote_pawn(selected_piece)
                             # После промоции проверяем окончание игры
-                            if not board.check_game_over(game.next_player):
+                            if not board.check_game_over(game.next_player, fill_cache=True):
                                 game.next_turn()
                         continue
 
@@ -64,16 +138,11 @@ class Main:
                     # if click square has a piece 
                     if board.squares[clicked_row][clicked_col].has_piece():
                         piece = board.squares[clicked_row][clicked_col].piece
-                        # valid piece color ?
-                        if piece.color == game.next_player:
-                            board.calc_moves(piece, clicked_row, clicked_col, bool=True)
+                        # valid piece color ? (engine pieces are not draggable)
+                        if piece.color == game.next_player and piece.color not in game.engines:
+                            board.load_moves(piece, clicked_row, clicked_col)
                             dragger.save_initial(event.pos)
                             dragger.drag_piece(piece)
-                            # show methods
-                            game.show_bg(screen) 
-                            game.show_last_move(screen)
-                            game.show_moves(screen)
-                            game.show_pieces(screen)
 
                 # mouse motion 
                 elif event.type == pygame.MOUSEMOTION:
@@ -87,13 +156,6 @@ class Main:
 
                     if dragger.dragging:
                         dragger.update_mouse(event.pos)
-                        # show methods
-                        game.show_bg(screen)
-                        game.show_moves(screen) 
-                        game.show_last_move(screen)
-                        game.show_pieces(screen)
-                        game.show_hover(screen)
-                        dragger.update_blit(screen)
 
                 # click release
                 elif event.type == pygame.MOUSEBUTTONUP:
@@ -115,19 +177,12 @@ class Main:
                         if board.valid_move(dragger.piece, move):
                             promotion_needed = board.move(dragger.piece, move)
 
-                            board.set_true_en_passant(dragger.piece)
-
-                            # draw show methods
-                            game.show_bg(screen)
-                            game.show_last_move(screen)
-                            game.show_pieces(screen)
-                            
                             # if no promotion, check for game over and next turn 
                             if not promotion_needed:
                                 # Сначала меняем игрока
                                 game.next_turn()
                                 # Затем проверяем мат/пат для нового игрока
-                                board.check_game_over(game.next_player)
+                                board.check_game_over(game.next_player, fill_cache=True)
                     
                     dragger.undrag_piece()
 
@@ -136,16 +191,46 @@ class Main:
 
                     # restart game 
                     if event.key == pygame.K_r:
+                        self.save_game()
                         game.reset()
                         game = self.game
                         board = self.game.board
                         dragger = self.game.dragger
+                        self.drawn = None
 
                 elif event.type == pygame.QUIT:
+                    self.save_game()
                     pygame.quit()
                     sys.exit()
 
-            pygame.display.update()
-
-main = Main()
-main.mainloop()
\ No newline at end of file
+                # the window was uncovered or resized
+                elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                    self.drawn = None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Chess')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='grid',
+                        help='position backend: Square grid or bitboards')
+    parser.add_argument('--engine', action='append', choices=['white', 'black'], default=[],
+                        help='let the engine play this color, may repeat')
+    parser.add_argument('--think', type=float, default=1.0,
+                        help='engine think time per move in seconds')
+    parser.add_argument('--depth', type=int, default=None,
+                        help='engine depth limit')
+    parser.add_argument('--fps', type=int, default=FPS,
+                        help='frame rate cap of the render loop')
+    parser.add_argument('--pgn', help='append played games to this PGN file')
+    parser.add_argument('--book', help='Polyglot opening book the engine plays from')
+    parser.add_argument('--tablebases', help='directory of the tbgen.py endgame tables')
+    args = parser.parse_args(argv)
+
+    book = OpeningBook(args.book) if args.book else None
+    tablebases = Tablebases(args.tablebases) if args.tablebases else None
+    engines = {color: Engine(time_limit=args.think, max_depth=args.depth or 64, book=book,
+                             tablebases=tablebases)
+               for color in args.engine}
+    Main(args.backend, engines, args.fps, args.pgn).mainloop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,59 @@
+from const import *
+from square import Square
+
+# files in algebraic notation and promotion letters used in move text
+FILES = 'abcdefgh'
+PROMOTION_LETTERS = {'queen': 'q', 'rook': 'r', 'bishop': 'b', 'knight': 'n'}
+
+# 16 bit packed moves: bits 0-5 initial square, 6-11 final square
+# (row * 8 + col), 12-13 promotion piece, 14 promotion flag
+PROMOTION_CODES = {'knight': 0, 'bishop': 1, 'rook': 2, 'queen': 3}
+CODE_PROMOTIONS = ['knight', 'bishop', 'rook', 'queen']
+PROMOTION_FLAG = 1 << 14
 
 class Move:
-    def __init__(self, initial, final):
+    __slots__ = ('initial', 'final', 'promotion')
+
+    def __init__(self, initial, final, promotion=None):
         # initial and final are squares
         self.initial = initial
         self.final = final
+        # piece name a pawn promotes to ('queen', 'rook', ...)
+        self.promotion = promotion
 
     def __eq__(self, other):
-        return self.initial == other.initial and self.final == other.final
\ No newline at end of file
+        return self.initial == other.initial and self.final == other.final
+
+    def __hash__(self):
+        # like __eq__, the squares only
+        return self.key()
+
+    def key(self):
+        # initial and final squares in 12 bits
+        return (self.initial.row * 8 + self.initial.col) | (self.final.row * 8 + self.final.col) << 6
+
+    def pack(self):
+        code = self.key()
+        if self.promotion:
+            code |= PROMOTION_FLAG | PROMOTION_CODES[self.promotion] << 12
+        return code
+
+    @classmethod
+    def unpack(cls, code):
+        '''
+        Move from the 16 bits of pack
+        '''
+        initial, final = code & 63, code >> 6 & 63
+        promotion = CODE_PROMOTIONS[code >> 12 & 3] if code & PROMOTION_FLAG else None
+        return cls(Square(initial // 8, initial % 8), Square(final // 8, final % 8), promotion)
+
+    def uci(self):
+        # coordinate notation like e2e4 or e7e8q
+        text = (f'{FILES[self.initial.col]}{ROWS - self.initial.row}'
+                f'{FILES[self.final.col]}{ROWS - self.final.row}')
+        if self.promotion:
+            text += PROMOTION_LETTERS[self.promotion]
+        return text
+
+    def __repr__(self):
+        return f'Move({self.uci()})'
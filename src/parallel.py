@@ -0,0 +1,199 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from bitboard import BACKENDS
+from engine import Engine, MATE, MAX_PLY, INFINITY
+from perft import POSITIONS
+
+# one engine per worker process so its transposition table outlives a task
+_engine = None
+_bounds = None
+
+
+def _init_worker(bounds):
+    # the shared root bounds can only reach a worker when it starts
+    global _bounds
+    _bounds = bounds
+
+
+def _search_root_moves(packed, backend, root_moves, time_limit, max_depth):
+    '''
+    Worker task: search a share of the root moves of a packed position
+    '''
+    global _engine
+    if _engine is None:
+        _engine = Engine()
+        _engine.shared_bounds = _bounds
+    board = BACKENDS[backend].unpack(packed)
+    iterations = []
+
+    def on_info(result):
+        iterations.append((result.depth, result.score, [move.uci() for move in result.pv]))
+
+    start = time.perf_counter()
+    result = _engine.search(board, time_limit=time_limit, max_depth=max_depth,
+                            on_info=on_info, root_moves=set(root_moves))
+    return {
+        'pid': os.getpid(),
+        'moves': len(root_moves),
+        'nodes': result.nodes,
+        'seconds': time.perf_counter() - start,
+        'iterations': iterations,
+    }
+
+
+class ParallelResult:
+    def __init__(self, best_move, pv, score, depth, nodes, seconds, workers):
+        self.best_move = best_move
+        self.pv = pv
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.seconds = seconds
+        self.nps = int(nodes / seconds) if seconds > 0 else nodes
+        self.workers = workers  # per task: pid, moves, nodes, seconds
+
+
+class ParallelSearch:
+    '''
+    Root splitting search over a process pool. The root moves are dealt
+    round-robin to the workers, which search their share with the normal
+    Engine. Positions travel as the 34 bytes of Board.pack. The workers
+    share the best root score of every depth, a worker searches its moves
+    against the best one found anywhere and only has to prove they are
+    not better. The best move is taken at the deepest iteration every
+    worker completed, so scores of different depths are never compared.
+    '''
+
+    def __init__(self, workers=None, backend='bitboard', time_limit=1.0, max_depth=MAX_PLY):
+        self.workers = workers or os.cpu_count() or 1
+        self.backend = backend
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.bounds = multiprocessing.Array('i', MAX_PLY + 2)
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.bounds,))
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def search(self, board, time_limit=None, max_depth=None):
+        time_limit = time_limit if time_limit is not None else self.time_limit
+        max_depth = max_depth or self.max_depth
+        start = time.perf_counter()
+
+        moves = board.legal_moves()
+        if not moves:
+            score = -MATE if board.is_in_check(board.next_player) else 0
+            return ParallelResult(None, [], score, 0, 0, 0, [])
+
+        # captures first so every worker gets a fair share of the forcing moves
+        moves.sort(key=lambda move: board.squares[move.final.row][move.final.col].has_piece(), reverse=True)
+        shares = [[move.uci() for move in moves[i::self.workers]] for i in range(self.workers)]
+        shares = [share for share in shares if share]
+
+        packed = board.pack()
+        self.bounds[:] = [-INFINITY] * len(self.bounds)
+        futures = [
+            self.pool.submit(_search_root_moves, packed, self.backend, share, time_limit, max_depth)
+            for share in shares
+        ]
+        reports = [future.result() for future in futures]
+
+        # deepest iteration finished by every worker
+        depth = min((r['iterations'][-1][0] if r['iterations'] else 0) for r in reports)
+        best = None
+        for report in reports:
+            for it_depth, score, pv in report['iterations']:
+                if it_depth == depth and pv and (best is None or score > best[0]):
+                    best = (score, pv)
+
+        by_uci = {move.uci(): move for move in moves}
+        if best is None:
+            best_move, pv, score = moves[0], [moves[0]], 0
+        else:
+            score, pv_text = best
+            best_move = by_uci[pv_text[0]]
+            pv = self._pv_moves(board, pv_text)
+
+        workers = [
+            {key: report[key] for key in ('pid', 'moves', 'nodes', 'seconds')}
+            for report in reports
+        ]
+        nodes = sum(report['nodes'] for report in reports)
+        return ParallelResult(best_move, pv, score, depth, nodes,
+                              time.perf_counter() - start, workers)
+
+    def _pv_moves(self, board, pv_text):
+        # turn the worker's UCI principal variation back into moves
+        pv, tokens = [], []
+        for text in pv_text:
+            move = next((m for m in board.legal_moves() if m.uci() == text), None)
+            if move is None:
+                break
+            pv.append(move)
+            tokens.append(board.make_move(move))
+        while tokens:
+            board.unmake_move(tokens.pop())
+        return pv
+
+
+def benchmark(workers, depth, names, backend='bitboard'):
+    '''
+    Fixed depth searches of the benchmark positions with 1..workers
+    processes, reports time to depth, nodes and speedup per pool size
+    '''
+    rows = []
+    base = None
+    for count in range(1, workers + 1):
+        with ParallelSearch(count, backend, time_limit=None, max_depth=depth) as search:
+            # warm the pool up so process start up is not timed
+            search.pool.submit(os.getpid).result()
+            seconds, nodes, per_worker = 0.0, 0, []
+            for name in names:
+                board = BACKENDS[backend].from_fen(POSITIONS[name][0])
+                result = search.search(board)
+                seconds += result.seconds
+                nodes += result.nodes
+                per_worker.append({'position': name, 'best': result.best_move.uci(),
+                                   'score': result.score, 'workers': result.workers})
+        base = base or seconds
+        rows.append({
+            'workers': count,
+            'seconds': round(seconds, 3),
+            'nodes': nodes,
+            'nps': int(nodes / seconds) if seconds > 0 else None,
+            'speedup': round(base / seconds, 2) if seconds > 0 else None,
+            'positions': per_worker,
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Parallel root splitting search benchmark')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='largest pool size, the benchmark runs 1..workers')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--position', action='append', choices=sorted(POSITIONS),
+                        help='benchmark position, may repeat (default all)')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='bitboard')
+    args = parser.parse_args(argv)
+
+    rows = benchmark(args.workers, args.depth, args.position or list(POSITIONS), args.backend)
+    json.dump({'depth': args.depth, 'backend': args.backend, 'runs': rows}, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
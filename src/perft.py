@@ -0,0 +1,133 @@
+import argparse
+import json
+import sys
+import time
+
+from bitboard import BACKENDS
+
+# well known test positions with their reference leaf counts per depth
+POSITIONS = {
+    'start': (
+        'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+        [20, 400, 8902, 197281, 4865609, 119060324],
+    ),
+    'kiwipete': (
+        'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+        [48, 2039, 97862, 4085603, 193690690],
+    ),
+    'position3': (
+        '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+        [14, 191, 2812, 43238, 674624, 11030083],
+    ),
+    'position4': (
+        'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+        [6, 264, 9467, 422333, 15833292],
+    ),
+    'position5': (
+        'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+        [44, 1486, 62379, 2103487, 89941194],
+    ),
+    'position6': (
+        'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+        [46, 2079, 89890, 3894594, 164075551],
+    ),
+}
+
+def perft(board, depth):
+    '''
+    Count the leaf nodes of the legal move tree depth plies deep
+    '''
+    moves = board.legal_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        token = board.make_move(move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move(token)
+    return nodes
+
+
+def divide(board, depth):
+    '''
+    Leaf counts below every root move, keyed by the move in UCI notation
+    '''
+    counts = {}
+    for move in board.legal_moves():
+        token = board.make_move(move)
+        counts[move.uci()] = perft(board, depth - 1)
+        board.unmake_move(token)
+    return counts
+
+
+def run(name, fen, depth, backend='grid', split=False, expected=None):
+    board = BACKENDS[backend].from_fen(fen)
+    start = time.perf_counter()
+    if split:
+        counts = divide(board, depth)
+        nodes = sum(counts.values())
+    else:
+        counts = None
+        nodes = perft(board, depth)
+    seconds = time.perf_counter() - start
+
+    result = {
+        'name': name,
+        'fen': fen,
+        'depth': depth,
+        'backend': backend,
+        'nodes': nodes,
+        'expected': expected,
+        'ok': None if expected is None else nodes == expected,
+        'seconds': round(seconds, 4),
+        'nps': int(nodes / seconds) if seconds > 0 else None,
+    }
+    if counts is not None:
+        result['divide'] = counts
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Count move generation leaf nodes (perft)')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--position', action='append', choices=sorted(POSITIONS) + ['all'],
+                        help='reference position to run, may repeat (default start)')
+    parser.add_argument('--fen', help='run a custom position instead')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='grid')
+    parser.add_argument('--divide', action='store_true', help='break counts down by root move')
+    args = parser.parse_args(argv)
+
+    if args.fen:
+        jobs = [('fen', args.fen, None)]
+    else:
+        names = args.position or ['start']
+        if 'all' in names:
+            names = list(POSITIONS)
+        jobs = []
+        for name in names:
+            fen, counts = POSITIONS[name]
+            expected = counts[args.depth - 1] if 0 < args.depth <= len(counts) else None
+            jobs.append((name, fen, expected))
+
+    results = [
+        run(name, fen, args.depth, args.backend, args.divide, expected)
+        for name, fen, expected in jobs
+    ]
+    nodes = sum(r['nodes'] for r in results)
+    seconds = sum(r['seconds'] for r in results)
+    report = {
+        'backend': args.backend,
+        'depth': args.depth,
+        'results': results,
+        'nodes': nodes,
+        'seconds': round(seconds, 4),
+        'nps': int(nodes / seconds) if seconds > 0 else None,
+        'ok': all(r['ok'] is not False for r in results),
+    }
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    return 0 if report['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,284 @@
+import bz2
+import gzip
+import re
+from itertools import chain
+
+from const import *
+from piece import *
+from move import FILES
+from board import START_FEN, DRAWS
+from bitboard import BACKENDS
+
+# SAN piece letters
+SAN_LETTERS = {'knight': 'N', 'bishop': 'B', 'rook': 'R', 'queen': 'Q', 'king': 'K'}
+SAN_PIECES = {letter: name for name, letter in SAN_LETTERS.items()}
+SAN_PROMOTIONS = {'Q': 'queen', 'R': 'rook', 'B': 'bishop', 'N': 'knight'}
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+# the seven tag roster, written first and in this order
+ROSTER = ['Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result']
+
+SAN_RE = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([QRBN]))?$')
+HEADER_RE = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+# comments, variation brackets, NAGs and everything else up to a space
+TOKEN_RE = re.compile(r'\{[^}]*\}?|;.*|\(|\)|\$\d+|[^\s(){};$]+')
+MOVE_NUMBER_RE = re.compile(r'^\d+\.+|^\d+$')
+
+
+class PGNError(ValueError):
+    pass
+
+
+def open_pgn(path, mode='r'):
+    '''
+    Text file object for path, .gz and .bz2 archives are (de)compressed
+    on the fly
+    '''
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', errors='replace')
+    if path.endswith('.bz2'):
+        return bz2.open(path, mode + 't', encoding='utf-8', errors='replace')
+    return open(path, mode, encoding='utf-8', errors='replace')
+
+
+def _square(text):
+    return ROWS - int(text[1]), FILES.index(text[0])
+
+
+def parse_san(board, text):
+    '''
+    Legal move of the side to move written in SAN
+    '''
+    san = text.rstrip('+#!?')
+    moves = board.legal_moves()
+    if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        col = 6 if len(san) == 3 else 2
+        for move in moves:
+            piece = board.squares[move.initial.row][move.initial.col].piece
+            if isinstance(piece, King) and move.final.col == col and abs(move.initial.col - col) == 2:
+                return move
+        raise PGNError(f'illegal move {text}')
+
+    match = SAN_RE.match(san)
+    if not match:
+        raise PGNError(f'bad move {text}')
+    letter, file, rank, final, promotion = match.groups()
+    name = SAN_PIECES[letter] if letter else 'pawn'
+    row, col = _square(final)
+    promotion = SAN_PROMOTIONS[promotion] if promotion else None
+
+    found = None
+    for move in moves:
+        if move.final.row != row or move.final.col != col or move.promotion != promotion:
+            continue
+        if board.squares[move.initial.row][move.initial.col].piece.name != name:
+            continue
+        if file and FILES[move.initial.col] != file:
+            continue
+        if rank and ROWS - move.initial.row != int(rank):
+            continue
+        if found:
+            raise PGNError(f'ambiguous move {text}')
+        found = move
+    if found is None:
+        raise PGNError(f'illegal move {text}')
+    return found
+
+
+def san(board, move):
+    '''
+    SAN of a legal move of the side to move, with check and mate marks
+    '''
+    piece = board.squares[move.initial.row][move.initial.col].piece
+    final = f'{FILES[move.final.col]}{ROWS - move.final.row}'
+    capture = (board.squares[move.final.row][move.final.col].has_piece()
+               or isinstance(piece, Pawn) and move.initial.col != move.final.col)
+
+    if isinstance(piece, King) and abs(move.initial.col - move.final.col) == 2:
+        text = 'O-O' if move.final.col == 6 else 'O-O-O'
+    elif isinstance(piece, Pawn):
+        text = (FILES[move.initial.col] + 'x' if capture else '') + final
+        if move.promotion:
+            text += '=' + SAN_LETTERS[move.promotion]
+    else:
+        # name the file, the rank or both when another piece of the kind could go there
+        others = [
+            other for other in board.legal_moves()
+            if other.final == move.final and not other.initial == move.initial
+            and board.squares[other.initial.row][other.initial.col].piece.name == piece.name
+        ]
+        hint = ''
+        if others:
+            if all(other.initial.col != move.initial.col for other in others):
+                hint = FILES[move.initial.col]
+            elif all(other.initial.row != move.initial.row for other in others):
+                hint = str(ROWS - move.initial.row)
+            else:
+                hint = FILES[move.initial.col] + str(ROWS - move.initial.row)
+        text = SAN_LETTERS[piece.name] + hint + ('x' if capture else '') + final
+
+    token = board.make_move(move)
+    if board.is_in_check(board.next_player):
+        text += '#' if not board.legal_moves() else '+'
+    board.unmake_move(token)
+    return text
+
+
+def _tokens(lines):
+    '''
+    Move text tokens of a game, comments and variations left out.
+    Stops at the game result or before the next header
+    '''
+    depth = 0
+    in_comment = False
+    for line in lines:
+        if in_comment:
+            end = line.find('}')
+            if end < 0:
+                continue
+            line = line[end + 1:]
+            in_comment = False
+        if line.startswith('%'):
+            continue
+        if line.startswith('[') and depth == 0:
+            yield line
+            return
+        for token in TOKEN_RE.findall(line):
+            if token[0] == '{':
+                in_comment = not token.endswith('}')
+            elif token[0] in ';$':
+                continue
+            elif token == '(':
+                depth += 1
+            elif token == ')':
+                depth -= 1
+            elif depth == 0:
+                # "12." or "12.e4", and the old "e.p." suffix
+                token = MOVE_NUMBER_RE.sub('', token)
+                if token and token != 'e.p.':
+                    yield token
+                if token in RESULTS:
+                    return
+
+
+def read_games(source, backend='bitboard', strict=True):
+    '''
+    Stream (headers, moves) of every game of a PGN file, path or open
+    text file. Only one game is held in memory at a time. SAN is
+    resolved against the legal moves of the board. A broken game raises
+    PGNError, or is skipped when strict is False
+    '''
+    if isinstance(source, str):
+        with open_pgn(source) as file:
+            yield from read_games(file, backend, strict)
+        return
+
+    lines = iter(source)
+    line = None  # line read ahead: the first line of the next game
+    while True:
+        headers = {}
+        # headers up to the first move text line
+        while True:
+            if line is None:
+                line = next(lines, None)
+                if line is None:
+                    return
+            line = line.strip()
+            match = HEADER_RE.match(line)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+            elif line and not line.startswith('%'):
+                break
+            line = None
+
+        board = BACKENDS[backend].from_fen(headers.get('FEN', START_FEN))
+        moves = []
+        error = None
+        tokens = _tokens(chain([line], lines))
+        line = None
+        for token in tokens:
+            if token.startswith('['):
+                line = token
+                break
+            if token in RESULTS:
+                headers.setdefault('Result', token)
+                break
+            if error:
+                continue
+            try:
+                move = parse_san(board, token)
+            except PGNError as e:
+                error = PGNError(f'{e} in game {headers.get("White", "?")} - {headers.get("Black", "?")}')
+                continue
+            board.make_move(move)
+            moves.append(move)
+
+        if error:
+            if strict:
+                raise error
+            continue
+        yield headers, moves
+
+
+def write_game(file, moves, headers=None, fen=START_FEN, backend='bitboard'):
+    '''
+    Write one game as PGN: headers (seven tag roster first) and SAN
+    move text wrapped at 80 columns
+    '''
+    headers = dict(headers or {})
+    result = headers.setdefault('Result', '*')
+    if fen != START_FEN:
+        headers.setdefault('SetUp', '1')
+        headers.setdefault('FEN', fen)
+    for key in ROSTER:
+        value = headers.get(key, '????.??.??' if key == 'Date' else '?')
+        file.write(f'[{key} "{_escape(value)}"]\n')
+    for key, value in headers.items():
+        if key not in ROSTER:
+            file.write(f'[{key} "{_escape(value)}"]\n')
+    file.write('\n')
+
+    board = BACKENDS[backend].from_fen(fen)
+    words = []
+    for move in moves:
+        if board.next_player == 'white':
+            words.append(f'{board.fullmove_number}.')
+        elif not words:
+            words.append(f'{board.fullmove_number}...')
+        words.append(san(board, move))
+        board.make_move(move)
+    words.append(result)
+
+    line = ''
+    for word in words:
+        if line and len(line) + 1 + len(word) > 80:
+            file.write(line + '\n')
+            line = word
+        else:
+            line = f'{line} {word}' if line else word
+    file.write(line + '\n\n')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def result_of(board):
+    '''
+    PGN result of a board's game_over state
+    '''
+    if board.game_over in DRAWS:
+        return '1/2-1/2'
+    return {'white': '1-0', 'black': '0-1'}.get(board.game_over, '*')
+
+
+def append_game(path, game, headers=None):
+    '''
+    Append the game played on a Game (or a bare board) to a PGN file,
+    the archive is never read
+    '''
+    board = getattr(game, 'board', game)
+    headers = dict(headers or {})
+    headers.setdefault('Result', result_of(board))
+    with open_pgn(path, 'a') as file:
+        write_game(file, board.move_stack, headers, board.start_fen or START_FEN)
@@ -1,52 +1,69 @@
-import os
-
 class Piece:
-    def __init__(self, name, color, value, texture=None, texture_rect=None):
+    # no per-instance dict: boards hold many pieces and copy them often
+    __slots__ = ('name', 'color', 'value', 'moves', 'targets', 'moved')
+
+    def __init__(self, name, color, value):
         self.name = name
         self.color = color
 
         value_sign = 1 if color == "white" else -1
         self.value = value * value_sign
         self.moves = []
+        self.targets = 0  # bitmask of the final squares of moves
         self.moved = False
-        self.texture = texture
-        self.set_texture()
-        self.texture_rect = texture_rect
-
-    def set_texture(self, size=80):
-        self.texture = os.path.join(
-            f'assets/images/imgs-{size}px/{self.color}_{self.name}.png'
-        )
+
     def add_move(self, move):
         self.moves.append(move)
+        self.targets |= 1 << (move.final.row * 8 + move.final.col)
 
     def clear_moves(self):
         self.moves = []
+        self.targets = 0
 
 class Pawn(Piece):
+    __slots__ = ('dir', 'en_passant')
+
     def __init__(self, color):
         self.dir = -1 if color == "white" else 1
         self.en_passant = False
         super().__init__('pawn', color, 1.0)
 
 class Knight(Piece):
+    __slots__ = ()
+
     def __init__(self, color):
         super().__init__('knight', color, 3.0)
 
 class Bishop(Piece):
+    __slots__ = ()
+
     def __init__(self, color):
         super().__init__('bishop', color, 3.001)
 
 class Rook(Piece):
+    __slots__ = ()
+
     def __init__(self, color):
         super().__init__('rook', color, 5.0)
 
 class Queen(Piece):
+    __slots__ = ()
+
     def __init__(self, color):
         super().__init__('queen', color, 9.0)
 
 class King(Piece):
+    __slots__ = ('left_rook', 'right_rook')
+
     def __init__(self, color):
         self.left_rook = None
         self.right_rook = None
         super().__init__('king', color, 100000.0)
+
+# piece classes a pawn can promote to
+PROMOTIONS = {
+    'queen': Queen,
+    'rook': Rook,
+    'bishop': Bishop,
+    'knight': Knight,
+}
@@ -0,0 +1,97 @@
+import argparse
+import json
+import sys
+import time
+
+from board import START_FEN
+from bitboard import BACKENDS
+from engine import Engine
+from book import OpeningBook
+from tablebase import Tablebases
+from pgn import append_game, result_of
+
+
+def find_move(board, text):
+    '''
+    Legal move of the side to move given in UCI notation, None if illegal
+    '''
+    for move in board.legal_moves():
+        if move.uci() == text:
+            return move
+    return None
+
+
+def play(board, moves=(), engines=None, max_plies=200, on_move=None):
+    '''
+    Replay moves (UCI strings) on board, then let engines (color -> Engine)
+    continue until the game ends, a side without an engine is to move or
+    max_plies is reached. No pygame needed. Returns the UCI moves played
+    '''
+    engines = engines or {}
+    played = []
+    pending = list(moves)
+    while not board.game_over and len(played) < max_plies:
+        if pending:
+            text = pending.pop(0)
+            move = find_move(board, text)
+            if move is None:
+                raise ValueError(f'illegal move {text}')
+        elif board.next_player in engines:
+            move = engines[board.next_player].search(board).best_move
+        else:
+            break
+        board.make_move(move)
+        played.append(move.uci())
+        board.check_game_over(board.next_player)
+        if on_move:
+            on_move(board, move)
+    return played
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play or replay a game without the GUI')
+    parser.add_argument('moves', nargs='*', help='moves to replay in UCI notation')
+    parser.add_argument('--fen', default=START_FEN, help='starting position')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='bitboard')
+    parser.add_argument('--engine', action='append', choices=['white', 'black'], default=[],
+                        help='let the engine continue for this color, may repeat')
+    parser.add_argument('--think', type=float, default=1.0,
+                        help='engine think time per move in seconds')
+    parser.add_argument('--depth', type=int, default=None,
+                        help='engine depth limit')
+    parser.add_argument('--max-plies', type=int, default=200)
+    parser.add_argument('--pgn', help='append the game to this PGN file (.gz/.bz2 compressed)')
+    parser.add_argument('--book', help='Polyglot opening book the engine plays from')
+    parser.add_argument('--tablebases', help='directory of the tbgen.py endgame tables')
+    args = parser.parse_args(argv)
+
+    book = OpeningBook(args.book) if args.book else None
+    tablebases = Tablebases(args.tablebases) if args.tablebases else None
+    engine = Engine(time_limit=args.think, max_depth=args.depth or 64, book=book, tablebases=tablebases)
+    engines = {color: engine for color in args.engine}
+
+    start = time.perf_counter()
+    try:
+        board = BACKENDS[args.backend].from_fen(args.fen)
+        played = play(board, args.moves, engines, args.max_plies)
+    except ValueError as error:
+        parser.error(str(error))
+    report = {
+        'fen': args.fen,
+        'backend': args.backend,
+        'moves': played,
+        'plies': len(played),
+        'result': result_of(board),
+        'final_fen': board.to_fen(),
+        'seconds': round(time.perf_counter() - start, 4),
+    }
+    if args.pgn:
+        append_game(args.pgn, board, {'White': 'engine' if 'white' in engines else '?',
+                                      'Black': 'engine' if 'black' in engines else '?'})
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,295 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from board import START_FEN
+from bitboard import BACKENDS
+from engine import Engine, MAX_PLY
+from encoding import move_index
+from pgn import result_of
+
+# Self-play games for training data, without the GUI. The games are dealt
+# out in shards, a worker task plays the games of one shard and writes
+# them as a compressed shard-NNNNN.npz:
+#   positions (N, 34) uint8   Board.pack of every position a move was played in
+#   moves     (N,)    uint16  encoding.move_index of the move played
+#   results   (N,)    int8    game result for the side to move: 1 win, 0 draw, -1 loss
+#   games     (N,)    uint32  game number in the run
+# manifest.json keeps the settings and the sha256 of every finished shard,
+# running again on the same directory only plays the missing shards.
+
+MANIFEST = 'manifest.json'
+RESULTS = {'1-0': 1, '0-1': -1}  # white's score, draws and unfinished games are 0
+
+
+class RandomPolicy:
+    '''
+    Uniformly random legal moves
+    '''
+
+    def choose(self, board, rng):
+        return rng.choice(board.legal_moves())
+
+
+class EnginePolicy:
+    '''
+    Engine search to a fixed depth and/or node count, no clock, so the
+    moves do not depend on the machine
+    '''
+
+    def __init__(self, depth=None, nodes=None):
+        self.engine = Engine(time_limit=None, max_depth=depth or MAX_PLY, max_nodes=nodes, tt_megabytes=4)
+
+    def choose(self, board, rng):
+        return self.engine.search(board).best_move
+
+
+def parse_policy(text):
+    '''
+    Policy of a spec: 'random', 'engine:depth=2', 'engine:nodes=5000'
+    or both limits, 'engine:depth=4,nodes=20000'
+    '''
+    name, _, options = text.partition(':')
+    if name == 'random' and not options:
+        return RandomPolicy()
+    if name == 'engine':
+        limits = {}
+        for option in filter(None, options.split(',')):
+            key, _, value = option.partition('=')
+            if key not in ('depth', 'nodes') or not value.isdigit() or int(value) < 1:
+                raise ValueError(f'bad engine option {option!r}')
+            limits[key] = int(value)
+        if not limits:
+            raise ValueError('engine policy needs depth= or nodes=')
+        return EnginePolicy(**limits)
+    raise ValueError(f'bad policy {text!r}')
+
+
+def play_game(board, policies, rng, random_plies=0, max_plies=400):
+    '''
+    Play out a game on board with policies (color -> policy), the first
+    random_plies moves at random so games differ. Returns (positions,
+    move indices, result for the side to move of every position)
+    '''
+    positions, moves, sides = [], [], []
+    board.check_game_over(board.next_player)
+    while not board.game_over and len(moves) < max_plies:
+        if len(moves) < random_plies:
+            move = rng.choice(board.legal_moves())
+        else:
+            move = policies[board.next_player].choose(board, rng)
+        positions.append(board.pack())
+        moves.append(move_index(move))
+        sides.append(1 if board.next_player == 'white' else -1)
+        board.make_move(move)
+        board.check_game_over(board.next_player)
+    score = RESULTS.get(result_of(board), 0)
+    return positions, moves, [score * side for side in sides]
+
+
+def _write(path, arrays):
+    # through a .part file, so a killed run never leaves half a shard behind
+    partial = path + '.part'
+    with open(partial, 'wb') as file:
+        np.savez_compressed(file, **arrays)
+    checksum = _sha256(partial)
+    os.replace(partial, path)
+    return checksum
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _play_shard(shard, directory, settings):
+    '''
+    Worker task: play the games of a shard and write its file, returns
+    the manifest entry
+    '''
+    start = time.perf_counter()
+    rng = random.Random(f"{settings['seed']}-{shard}")
+    # fresh policies per shard: an engine table carried over from other
+    # shards would make the moves depend on what the worker played before
+    policies = {'white': parse_policy(settings['white']), 'black': parse_policy(settings['black'])}
+    board_class = BACKENDS[settings['backend']]
+    positions, moves, results, games = [], [], [], []
+    scores = {1: 0, 0: 0, -1: 0}
+    first = shard * settings['games']
+    for game in range(first, first + settings['games']):
+        board = board_class.from_fen(settings['fen'])
+        packed, played, outcome = play_game(board, policies, rng, settings['random_plies'],
+                                            settings['max_plies'])
+        positions.extend(packed)
+        moves.extend(played)
+        results.extend(outcome)
+        games.extend([game] * len(played))
+        scores[RESULTS.get(result_of(board), 0)] += 1
+
+    name = f'shard-{shard:05d}.npz'
+    checksum = _write(os.path.join(directory, name), {
+        'positions': np.frombuffer(b''.join(positions), dtype=np.uint8).reshape(-1, 34),
+        'moves': np.array(moves, dtype=np.uint16),
+        'results': np.array(results, dtype=np.int8),
+        'games': np.array(games, dtype=np.uint32),
+    })
+    return {
+        'shard': shard,
+        'file': name,
+        'sha256': checksum,
+        'games': settings['games'],
+        'positions': len(moves),
+        'white_wins': scores[1],
+        'draws': scores[0],
+        'black_wins': scores[-1],
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def _save_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST)
+    with open(path + '.part', 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(path + '.part', path)
+
+
+def load_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def verify(directory, manifest=None):
+    '''
+    Numbers of the finished shards whose file is missing or does not
+    match its checksum
+    '''
+    manifest = manifest or load_manifest(directory) or {'shards': {}}
+    bad = []
+    for key, entry in manifest['shards'].items():
+        path = os.path.join(directory, entry['file'])
+        if not os.path.exists(path) or _sha256(path) != entry['sha256']:
+            bad.append(int(key))
+    return sorted(bad)
+
+
+def read_shards(directory):
+    '''
+    (positions, moves, results, games) arrays of the finished shards of
+    a run in shard order, checksums checked
+    '''
+    manifest = load_manifest(directory)
+    if manifest is None:
+        return
+    for key in sorted(manifest['shards'], key=int):
+        entry = manifest['shards'][key]
+        path = os.path.join(directory, entry['file'])
+        if _sha256(path) != entry['sha256']:
+            raise ValueError(f'checksum mismatch in {path}')
+        with np.load(path) as data:
+            yield data['positions'], data['moves'], data['results'], data['games']
+
+
+def generate(directory, shards, settings, workers=None, log=None):
+    '''
+    Play shards shards of settings['games'] games each into directory
+    over a process pool. Shards a previous run finished (and that still
+    match their checksum) are kept. Returns the manifest
+    '''
+    os.makedirs(directory, exist_ok=True)
+    manifest = load_manifest(directory)
+    if manifest is None:
+        manifest = {'settings': settings, 'shards': {}}
+    elif manifest['settings'] != settings:
+        raise ValueError(f'{directory} holds a run with other settings')
+    for shard in verify(directory, manifest):
+        del manifest['shards'][str(shard)]
+    _save_manifest(directory, manifest)
+
+    todo = [shard for shard in range(shards) if str(shard) not in manifest['shards']]
+    if not todo:
+        return manifest
+    with ProcessPoolExecutor(min(workers or os.cpu_count() or 1, len(todo))) as pool:
+        futures = [pool.submit(_play_shard, shard, directory, settings) for shard in todo]
+        for future in as_completed(futures):
+            entry = future.result()
+            manifest['shards'][str(entry['shard'])] = entry
+            _save_manifest(directory, manifest)
+            if log:
+                log(entry)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a self-play dataset over a process pool')
+    parser.add_argument('directory', help='output directory, a run there is resumed')
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--games', type=int, default=100, help='games per shard')
+    parser.add_argument('--white', default='random', help="policy: random, engine:depth=N, engine:nodes=N")
+    parser.add_argument('--black', default='random')
+    parser.add_argument('--random-plies', type=int, default=0,
+                        help='plies played at random before the policies take over')
+    parser.add_argument('--max-plies', type=int, default=400, help='longer games count as draws')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fen', default=START_FEN)
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='bitboard')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    try:
+        parse_policy(args.white)
+        parse_policy(args.black)
+        BACKENDS[args.backend].from_fen(args.fen)
+    except ValueError as error:
+        parser.error(str(error))
+    settings = {
+        'white': args.white, 'black': args.black, 'games': args.games, 'seed': args.seed,
+        'random_plies': args.random_plies, 'max_plies': args.max_plies, 'fen': args.fen,
+        'backend': args.backend,
+    }
+
+    played = []  # entries of the shards this run played
+
+    def log(entry):
+        played.append(entry)
+        print(f"shard {entry['shard']}: {entry['positions']} positions", file=sys.stderr)
+
+    start = time.perf_counter()
+    try:
+        manifest = generate(args.directory, args.shards, settings, args.workers, log)
+    except ValueError as error:
+        parser.error(str(error))
+    seconds = time.perf_counter() - start
+    entries = manifest['shards'].values()
+    new_positions = sum(entry['positions'] for entry in played)
+    report = {
+        'directory': args.directory,
+        'shards': len(manifest['shards']),
+        'games': sum(entry['games'] for entry in entries),
+        'positions': sum(entry['positions'] for entry in entries),
+        'white_wins': sum(entry['white_wins'] for entry in entries),
+        'draws': sum(entry['draws'] for entry in entries),
+        'black_wins': sum(entry['black_wins'] for entry in entries),
+        'played_shards': len(played),
+        'seconds': round(seconds, 3),
+        'positions_per_second': int(new_positions / seconds) if seconds > 0 else None,
+    }
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,7 @@
 
 class Square:
+    __slots__ = ('row', 'col', 'piece')
+
     def __init__(self, row, col, piece=None):
         self.row = row 
         self.col = col 
@@ -7,6 +9,9 @@ class Square:
 
     def __eq__(self, other):
         return self.row == other.row and self.col == other.col
+
+    def __hash__(self):
+        return self.row * 8 + self.col
     
     def has_piece(self):
         return self.piece != None
@@ -0,0 +1,233 @@
+import argparse
+import json
+import mmap
+import os
+import sys
+
+from const import *
+from piece import *
+from board import START_FEN
+from bitboard import BACKENDS
+
+# Endgame tables of a king and a few pieces against a lone king, made by
+# tbgen.py. A table file is a 16 byte header (MAGIC and the signature)
+# and one byte per index:
+#   0  draw, 1  illegal position,
+#   2 + n  mate n plies away, n odd: the side to move mates, n even: it
+#          gets mated (n = 0: it is mated)
+# The side with the pieces is stored as white, a board where black has
+# them is looked up with ranks and colors swapped.
+MAGIC = b'MLTB'
+HEADER = 16
+DRAW, ILLEGAL = 0, 1
+
+SIGNATURES = ['KQK', 'KRK', 'KPK', 'KBNK']
+# order of the extra pieces in a signature
+LETTERS = {'queen': 'Q', 'rook': 'R', 'bishop': 'B', 'knight': 'N', 'pawn': 'P'}
+PIECE_ORDER = 'QRBNP'
+
+
+def _canonical_maps(pawns):
+    '''
+    Per white king square the square mapping that brings the king into
+    the a1-d1-d4 triangle (files a-d only with pawns, which can not be
+    turned or mirrored between ranks)
+    '''
+    maps = []
+    for king in range(64):
+        row, col = divmod(king, 8)
+        flip_col = col > 3
+        flip_row = not pawns and row < 4
+        rank, file = 7 - (7 - row if flip_row else row), 7 - col if flip_col else col
+        transpose = not pawns and rank > file
+        mapping = []
+        for sq in range(64):
+            r, c = divmod(sq, 8)
+            if flip_col:
+                c = 7 - c
+            if flip_row:
+                r = 7 - r
+            if transpose:
+                r, c = 7 - c, 7 - r
+            mapping.append(r * 8 + c)
+        maps.append(mapping)
+    return maps
+
+
+CANONICAL = {False: _canonical_maps(False), True: _canonical_maps(True)}
+# white king squares a table keeps, in index order
+KING_SQUARES = {
+    False: [row * 8 + col for row in range(4, 8) for col in range(4) if col >= 7 - row],
+    True: [row * 8 + col for row in range(8) for col in range(4)],
+}
+KING_SLOTS = {pawns: {sq: slot for slot, sq in enumerate(squares)} for pawns, squares in KING_SQUARES.items()}
+
+
+def has_pawns(signature):
+    return 'P' in signature
+
+
+def table_size(signature):
+    return 2 * len(KING_SQUARES[has_pawns(signature)]) * 64 ** (len(signature) - 1)
+
+
+def index(signature, black_to_move, squares):
+    '''
+    Table index of a position: squares are the white king, the black
+    king and the pieces in signature order
+    '''
+    pawns = has_pawns(signature)
+    mapping = CANONICAL[pawns][squares[0]]
+    i = black_to_move * len(KING_SQUARES[pawns]) + KING_SLOTS[pawns][mapping[squares[0]]]
+    for sq in squares[1:]:
+        i = i * 64 + mapping[sq]
+    return i
+
+
+def decode(value):
+    '''
+    (result, plies) of a table byte for the side to move, result is
+    'win', 'loss' or 'draw' (plies None); None for illegal positions
+    '''
+    if value == ILLEGAL:
+        return None
+    if value == DRAW:
+        return 'draw', None
+    plies = value - 2
+    return ('win' if plies % 2 else 'loss'), plies
+
+
+def lookup(board):
+    '''
+    (signature, black_to_move, squares) of board as a table position,
+    the side with the pieces turned into white. None when the material
+    has no table or castling rights are left
+    '''
+    if board.castling:
+        return None
+    pieces = {'white': [], 'black': []}
+    kings = {}
+    for row in range(ROWS):
+        for col in range(COLS):
+            piece = board.squares[row][col].piece
+            if piece is None:
+                continue
+            if isinstance(piece, King):
+                kings[piece.color] = row * 8 + col
+            else:
+                pieces[piece.color].append((PIECE_ORDER.index(LETTERS[piece.name]), row * 8 + col))
+    if len(kings) != 2 or (pieces['white'] and pieces['black']):
+        return None
+    strong = 'white' if pieces['white'] else 'black'
+    weak = 'black' if strong == 'white' else 'white'
+    extras = sorted(pieces[strong])
+    signature = 'K' + ''.join(PIECE_ORDER[order] for order, sq in extras) + 'K'
+    squares = [kings[strong], kings[weak]] + [sq for order, sq in extras]
+    if strong == 'black':
+        # swap colors: ranks mirror, so black pawns run up the board as white ones
+        squares = [(7 - sq // 8) * 8 + sq % 8 for sq in squares]
+    return signature, int(board.next_player != strong), squares
+
+
+class Tablebases:
+    '''
+    The table files of a directory, memory mapped when first needed.
+    Probes are a table index and a byte read
+    '''
+
+    def __init__(self, directory='tablebases'):
+        self.directory = directory
+        self.tables = {}  # signature -> mmap, None when there is no file
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        self.tables = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def table(self, signature):
+        if signature not in self.tables:
+            path = os.path.join(self.directory, f'{signature}.mltb')
+            table = None
+            if os.path.exists(path):
+                with open(path, 'rb') as file:
+                    table = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                if (table[:4] != MAGIC or table[4:HEADER].rstrip(b'\0') != signature.encode()
+                        or len(table) != HEADER + table_size(signature)):
+                    table.close()
+                    raise ValueError(f'bad table file {path}')
+            self.tables[signature] = table
+        return self.tables[signature]
+
+    def probe(self, board):
+        '''
+        (result, plies) of board for the side to move, see decode.
+        None when there is no table for it
+        '''
+        position = lookup(board)
+        if position is None:
+            return None
+        signature, black_to_move, squares = position
+        table = self.table(signature)
+        if table is None:
+            return None
+        return decode(table[HEADER + index(signature, black_to_move, squares)])
+
+    def best_move(self, board):
+        '''
+        (move, result, plies) of the table move of board: the fastest
+        mate when winning, the longest defence when losing, None when
+        the position has no table
+        '''
+        probe = self.probe(board)
+        if probe is None:
+            return None
+        best, best_rank = None, None
+        for move in board.legal_moves():
+            token = board.make_move(move)
+            # captures into bare kings (no table) are draws
+            reply = self.probe(board) or ('draw', None)
+            board.unmake_move(token)
+            result, plies = reply
+            # rank the move from our side: mate soonest, get mated last
+            if result == 'loss':
+                rank = (2, -plies)
+            elif result == 'draw':
+                rank = (1, 0)
+            else:
+                rank = (0, plies)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = move, rank
+        if best is None:
+            return None
+        return best, probe[0], probe[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Probe the endgame tables')
+    parser.add_argument('--fen', default=START_FEN)
+    parser.add_argument('--directory', default='tablebases')
+    args = parser.parse_args(argv)
+
+    try:
+        board = BACKENDS['bitboard'].from_fen(args.fen)
+    except ValueError as error:
+        parser.error(str(error))
+    with Tablebases(args.directory) as tables:
+        probe = tables.probe(board)
+        best = tables.best_move(board)
+    report = {'fen': board.to_fen(), 'result': probe and probe[0], 'plies': probe and probe[1],
+              'best': best and best[0].uci()}
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
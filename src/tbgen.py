@@ -0,0 +1,384 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from tablebase import (MAGIC, HEADER, DRAW, ILLEGAL, SIGNATURES, CANONICAL, KING_SQUARES,
+                       KING_SLOTS, has_pawns, table_size)
+
+# Retrograde generation of the tablebase.py tables. Pass n settles the
+# positions mated in exactly n plies from the values of their successors:
+# a position is won once a move reaches a lost one and lost once every
+# move reaches a won one. Promotions reach tables with mates of any
+# length, so a position is only written on the pass of its own length,
+# which keeps every mate the shortest one. Passes stop when nothing is
+# left to settle, the rest is drawn. The positions of a pass are split
+# over a process pool, each worker maps the table file read only and
+# vectorizes its slice with NumPy.
+
+KING_STEPS = [(-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1)]
+KNIGHT_STEPS = [(-2, 1), (-1, 2), (1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1)]
+ROOK_STEPS = [(-1, 0), (0, 1), (1, 0), (0, -1)]
+BISHOP_STEPS = [(-1, 1), (1, 1), (1, -1), (-1, -1)]
+SLIDERS = {'Q': ROOK_STEPS + BISHOP_STEPS, 'R': ROOK_STEPS, 'B': BISHOP_STEPS}
+# tables a promotion leads to, bishop and knight promotions only draw
+PROMOTIONS = {'KPK': ['KQK', 'KRK']}
+SLICE = 1 << 18  # positions per worker task
+
+BIT = np.array([1 << sq for sq in range(64)], dtype=np.uint64)
+
+
+def _step_table(steps):
+    # TARGETS[i, sq]: square one step i away, -1 off the board
+    table = np.full((len(steps), 64), -1, dtype=np.int64)
+    for i, (dr, dc) in enumerate(steps):
+        for sq in range(64):
+            row, col = sq // 8 + dr, sq % 8 + dc
+            if 0 <= row < 8 and 0 <= col < 8:
+                table[i, sq] = row * 8 + col
+    return table
+
+
+KING_TARGETS = _step_table(KING_STEPS)
+KNIGHT_TARGETS = _step_table(KNIGHT_STEPS)
+
+
+def _geometry():
+    adjacent = np.zeros((64, 64), dtype=bool)
+    knight = np.zeros((64, 64), dtype=bool)
+    pawn = np.zeros((64, 64), dtype=bool)  # white pawn on a attacks b
+    straight = np.zeros((64, 64), dtype=bool)
+    diagonal = np.zeros((64, 64), dtype=bool)
+    between = np.zeros((64, 64), dtype=np.uint64)
+    for a in range(64):
+        for b in KING_TARGETS[:, a]:
+            if b >= 0:
+                adjacent[a, b] = True
+        for b in KNIGHT_TARGETS[:, a]:
+            if b >= 0:
+                knight[a, b] = True
+        row, col = divmod(a, 8)
+        for dc in (-1, 1):
+            if row > 0 and 0 <= col + dc < 8:
+                pawn[a, (row - 1) * 8 + col + dc] = True
+        for lines, steps in ((straight, ROOK_STEPS), (diagonal, BISHOP_STEPS)):
+            for dr, dc in steps:
+                r, c, path = row + dr, col + dc, 0
+                while 0 <= r < 8 and 0 <= c < 8:
+                    lines[a, r * 8 + c] = True
+                    between[a, r * 8 + c] = path
+                    path |= 1 << (r * 8 + c)
+                    r, c = r + dr, c + dc
+    return adjacent, knight, pawn, straight, diagonal, between
+
+
+ADJACENT, KNIGHT, PAWN, STRAIGHT, DIAGONAL, BETWEEN = _geometry()
+CANONICAL_TABLES = {pawns: np.array(maps, dtype=np.int64) for pawns, maps in CANONICAL.items()}
+SLOT_TABLES = {}
+for _pawns, _slots in KING_SLOTS.items():
+    SLOT_TABLES[_pawns] = np.full(64, -1, dtype=np.int64)
+    for _sq, _slot in _slots.items():
+        SLOT_TABLES[_pawns][_sq] = _slot
+
+
+def _attacks(kind, source, target, occupied):
+    '''
+    Does the white piece kind on source attack target (arrays)?
+    '''
+    if kind == 'K':
+        return ADJACENT[source, target]
+    if kind == 'N':
+        return KNIGHT[source, target]
+    if kind == 'P':
+        return PAWN[source, target]
+    if kind == 'R':
+        lines = STRAIGHT[source, target]
+    elif kind == 'B':
+        lines = DIAGONAL[source, target]
+    else:
+        lines = STRAIGHT[source, target] | DIAGONAL[source, target]
+    return lines & (BETWEEN[source, target] & occupied == 0)
+
+
+class Table:
+    '''
+    Index arithmetic of one signature over NumPy arrays
+    '''
+
+    def __init__(self, signature):
+        self.signature = signature
+        self.kinds = signature[1:-1]  # white pieces besides the king
+        self.pawns = has_pawns(signature)
+        self.slots = len(KING_SQUARES[self.pawns])
+        self.size = table_size(signature)
+
+    def decode(self, indices):
+        # (black_to_move, [white king, black king, pieces...]) of indices
+        rest = indices.copy()
+        pieces = []
+        for kind in self.kinds:
+            pieces.append(rest % 64)
+            rest //= 64
+        black_king = rest % 64
+        rest //= 64
+        king = np.array(KING_SQUARES[self.pawns], dtype=np.int64)[rest % self.slots]
+        return rest // self.slots, [king, black_king] + pieces[::-1]
+
+    def encode(self, black_to_move, squares):
+        # indices of positions, squares are brought to the canonical side first
+        maps = CANONICAL_TABLES[self.pawns]
+        king = squares[0]
+        indices = black_to_move * self.slots + SLOT_TABLES[self.pawns][maps[king, king]]
+        for sq in squares[1:]:
+            indices = indices * 64 + maps[king, sq]
+        return indices
+
+
+def _check_positions(table, indices):
+    '''
+    Static facts of positions: legal, black in check, occupied squares
+    '''
+    black_to_move, squares = table.decode(indices)
+    king, black_king, pieces = squares[0], squares[1], squares[2:]
+    occupied = np.zeros(len(indices), dtype=np.uint64)
+    legal = ~ADJACENT[king, black_king]
+    for sq in squares:
+        legal &= occupied & BIT[sq] == 0
+        occupied |= BIT[sq]
+    for kind, sq in zip(table.kinds, pieces):
+        if kind == 'P':
+            legal &= (sq >= 8) & (sq < 56)
+    in_check = np.zeros(len(indices), dtype=bool)
+    for kind, sq in zip(table.kinds, pieces):
+        in_check |= _attacks(kind, sq, black_king, occupied)
+    # black in check with white to move
+    legal &= (black_to_move == 1) | ~in_check
+    return black_to_move, squares, occupied, legal, in_check
+
+
+class Moves:
+    '''
+    Collects the successor values of a batch of positions
+    '''
+
+    def __init__(self, n):
+        self.count = np.zeros(n, dtype=np.int64)
+        self.win = np.full(n, 255, dtype=np.int64)  # shortest mate found
+        self.lost = np.zeros(n, dtype=np.int64)  # moves into a won position
+        self.worst = np.zeros(n, dtype=np.int64)  # longest mate against us
+
+    def add(self, ok, values):
+        # values: successor bytes where ok, the successor is seen by the other side
+        plies = values.astype(np.int64) - 2
+        decided = ok & (values >= 2)
+        self.count += ok
+        self.win = np.where(decided & (plies % 2 == 0), np.minimum(self.win, plies + 1), self.win)
+        opponent_wins = decided & (plies % 2 == 1)
+        self.lost += opponent_wins
+        self.worst = np.where(opponent_wins, np.maximum(self.worst, plies + 1), self.worst)
+
+    def result(self):
+        value = np.zeros(len(self.count), dtype=np.uint8)
+        won = self.win < 255
+        value[won] = self.win[won] + 2
+        lost = ~won & (self.count > 0) & (self.lost == self.count)
+        value[lost] = self.worst[lost] + 2
+        return value
+
+
+def _white_targets(kind, source, occupied):
+    '''
+    (target, ok) pairs of the moves of a white piece, ok still ignores
+    what stands on the target
+    '''
+    if kind in ('K', 'N'):
+        steps = KING_TARGETS if kind == 'K' else KNIGHT_TARGETS
+        for step in range(8):
+            target = steps[step, source]
+            yield target, target >= 0
+    elif kind == 'P':
+        push = np.maximum(source - 8, 0)
+        yield push, source >= 8
+        jump = np.maximum(source - 16, 0)
+        yield jump, (source >= 48) & (occupied & BIT[push] == 0)
+    else:
+        others = occupied & ~BIT[source]
+        row, col = source // 8, source % 8
+        for dr, dc in SLIDERS[kind]:
+            for distance in range(1, 8):
+                r, c = row + dr * distance, col + dc * distance
+                inside = (r >= 0) & (r < 8) & (c >= 0) & (c < 8)
+                target = np.where(inside, r * 8 + c, 0)
+                yield target, inside & (BETWEEN[source, target] & others == 0)
+
+
+def _successors(table, black_to_move, squares, occupied, lookup, promotions):
+    '''
+    Values of the positions after every legal move, gathered in a Moves
+    '''
+    n = len(black_to_move)
+    moves = Moves(n)
+    king, black_king, pieces = squares[0], squares[1], squares[2:]
+    black = black_to_move == 1
+
+    # black: king steps, a capture leaves a bare king ending, a draw
+    vacated = occupied & ~BIT[black_king]
+    for step in range(8):
+        target = KING_TARGETS[step, black_king]
+        ok = black & (target >= 0)
+        target = np.where(ok, target, 0)
+        ok &= ~ADJACENT[king, target]
+        capture = np.zeros(n, dtype=bool)
+        for kind, sq in zip(table.kinds, pieces):
+            hit = sq == target
+            capture |= hit
+            ok &= hit | ~_attacks(kind, sq, target, vacated)
+        after = [king, target] + pieces
+        values = np.where(ok & ~capture, lookup(0, after), DRAW)
+        moves.add(ok, values)
+
+    # white: every piece
+    white = ~black
+    for i, kind in enumerate('K' + table.kinds):
+        source = squares[i if i == 0 else i + 1]
+        for target, ok in _white_targets(kind, source, occupied):
+            ok = white & ok
+            target = np.where(ok, target, 0)
+            ok &= occupied & BIT[target] == 0
+            if kind == 'K':
+                ok &= ~ADJACENT[black_king, target]
+            after = list(squares)
+            after[i if i == 0 else i + 1] = target
+            if kind == 'P':
+                # promotions go to the tables of the new piece, black to move
+                promotes = target < 8
+                for promoted in promotions:
+                    values = np.where(ok & promotes, promoted(1, [king, black_king, target]), DRAW)
+                    moves.add(ok & promotes, values)
+                ok &= ~promotes
+            values = np.where(ok, lookup(1, after), DRAW)
+            moves.add(ok, values)
+    return moves
+
+
+def _load(signature, directory):
+    path = os.path.join(directory, f'{signature}.mltb')
+    return np.memmap(path, dtype=np.uint8, mode='r', offset=HEADER, shape=(table_size(signature),))
+
+
+def _lookup(signature, data):
+    table = Table(signature)
+
+    def lookup(black_to_move, squares):
+        indices = table.encode(np.full(len(squares[0]), black_to_move), squares)
+        return data[indices]
+    return lookup
+
+
+def _pass(signature, directory, path, start, stop, plies):
+    '''
+    Worker task: the positions of start..stop mated in plies, returned
+    as (indices, values, pending), pending counts the undecided ones that
+    already see a longer mate. Pass 0 marks illegal positions and
+    checkmates
+    '''
+    table = Table(signature)
+    indices = np.arange(start, stop, dtype=np.int64)
+    if plies == 0:
+        black_to_move, squares, occupied, legal, in_check = _check_positions(table, indices)
+        values = np.where(legal, DRAW, ILLEGAL).astype(np.uint8)
+        # any black move at all? stalemate stays a draw
+        moves = _successors(table, black_to_move, squares, occupied,
+                            lambda side, after: np.zeros(len(indices), dtype=np.uint8), [])
+        mated = legal & (black_to_move == 1) & in_check & (moves.count == 0)
+        values[mated] = 2
+        changed = values != DRAW
+        return indices[changed], values[changed], 0
+
+    data = np.memmap(path, dtype=np.uint8, mode='r', offset=HEADER, shape=(table.size,))
+    undecided = indices[np.asarray(data[start:stop]) == DRAW]
+    if not len(undecided):
+        return undecided, np.zeros(0, dtype=np.uint8), 0
+    black_to_move, squares, occupied, legal, in_check = _check_positions(table, undecided)
+    promotions = [_lookup(name, _load(name, directory)) for name in PROMOTIONS.get(signature, [])]
+    moves = _successors(table, black_to_move, squares, occupied, _lookup(signature, data), promotions)
+    values = moves.result()
+    changed = values == plies + 2
+    pending = int(np.count_nonzero(values > plies + 2))
+    return undecided[changed], values[changed], pending
+
+
+def generate(signature, directory='tablebases', workers=None, log=None):
+    '''
+    Build the table of a signature into directory (tables its
+    promotions lead to must be there already). Returns the pass count
+    '''
+    for name in PROMOTIONS.get(signature, []):
+        if not os.path.exists(os.path.join(directory, f'{name}.mltb')):
+            raise FileNotFoundError(f'{signature} needs the {name} table in {directory}, build {name} first')
+    os.makedirs(directory, exist_ok=True)
+    size = table_size(signature)
+    path = os.path.join(directory, f'{signature}.mltb')
+    partial = path + '.part'
+    with open(partial, 'wb') as file:
+        file.write(MAGIC + signature.encode().ljust(HEADER - len(MAGIC), b'\0'))
+        file.truncate(HEADER + size)
+    data = np.memmap(partial, dtype=np.uint8, mode='r+', offset=HEADER, shape=(size,))
+
+    slices = [(start, min(start + SLICE, size)) for start in range(0, size, SLICE)]
+    passes = 0
+    with ProcessPoolExecutor(workers or os.cpu_count() or 1) as pool:
+        while True:
+            data.flush()
+            futures = [pool.submit(_pass, signature, directory, partial, start, stop, passes)
+                       for start, stop in slices]
+            # every worker reads the table of the last pass, write after all are done
+            results = [future.result() for future in futures]
+            changed = pending = 0
+            for indices, values, waiting in results:
+                data[indices] = values
+                changed += len(indices)
+                pending += waiting
+            passes += 1
+            if log:
+                log(signature, passes, changed)
+            if not changed and not pending and passes > 1:
+                break
+    data.flush()
+    del data
+    os.replace(partial, path)
+    return passes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate endgame tables by retrograde analysis')
+    parser.add_argument('signatures', nargs='*', default=SIGNATURES,
+                        help='tables to build (default all), KPK needs KQK and KRK')
+    parser.add_argument('--directory', default='tablebases')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+    for signature in args.signatures:
+        if signature not in SIGNATURES:
+            parser.error(f'no table {signature}, choose from {", ".join(SIGNATURES)}')
+
+    report = []
+    for signature in sorted(args.signatures, key=SIGNATURES.index):
+        start = time.perf_counter()
+        try:
+            passes = generate(signature, args.directory, args.workers,
+                              lambda name, n, changed: print(f'{name} pass {n}: {changed} positions', file=sys.stderr))
+        except FileNotFoundError as error:
+            parser.error(str(error))
+        report.append({'table': signature, 'positions': table_size(signature), 'passes': passes,
+                       'seconds': round(time.perf_counter() - start, 2)})
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import os
+import pygame
+
+from board import FEN_LETTERS
+
+IMAGES_DIR = os.path.join('assets', 'images')
+COLORS = ['white', 'black']
+NAMES = ['pawn', 'knight', 'bishop', 'rook', 'queen', 'king']
+SIZES = [80, 128]
+
+
+class TextureCache:
+    '''
+    Piece images loaded once from assets/images and shared by every
+    frame. Needs a display mode to be set first (convert_alpha).
+    '''
+
+    def __init__(self, sizes=SIZES, directory=IMAGES_DIR):
+        self.surfaces = {}
+        for size in sizes:
+            for color in COLORS:
+                for name in NAMES:
+                    path = os.path.join(directory, f'imgs-{size}px', f'{color}_{name}.png')
+                    try:
+                        image = pygame.image.load(path).convert_alpha()
+                    except (pygame.error, FileNotFoundError):
+                        image = fallback(color, name, size)
+                    self.surfaces[(color, name, size)] = image
+
+    def get(self, color, name, size=80):
+        '''
+        Shared Surface of the piece image, a lettered disc if the image
+        could not be loaded
+        '''
+        return self.surfaces.get((color, name, size))
+
+    def piece(self, piece, size=80):
+        return self.get(piece.color, piece.name, size)
+
+
+def fallback(color, name, size):
+    '''
+    Stand-in for a missing piece image: a disc of the piece's color
+    with its letter (N for the knight), the same size as the image
+    '''
+    ink, paper = ((0, 0, 0), (255, 255, 255)) if color == 'white' else ((255, 255, 255), (0, 0, 0))
+    surface = pygame.Surface((size, size), pygame.SRCALPHA)
+    pygame.draw.circle(surface, paper, (size // 2, size // 2), size * 3 // 8)
+    pygame.draw.circle(surface, ink, (size // 2, size // 2), size * 3 // 8, 2)
+    text = pygame.font.Font(None, size // 2).render(FEN_LETTERS[name].upper(), True, ink)
+    surface.blit(text, text.get_rect(center=(size // 2, size // 2)))
+    return surface
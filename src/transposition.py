@@ -0,0 +1,69 @@
+from array import array
+
+# entry flags: the stored value is exact, a lower bound or an upper bound
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# bytes per slot: key 8, value 4, depth 1, flag 1, age 1, packed move 2
+ENTRY_BYTES = 17
+
+
+class TranspositionTable:
+    '''
+    Fixed size table of search results keyed by Board.hash.
+    Every bucket has two slots: the first keeps the deepest result
+    (depth-preferred), the second is always replaced. Fields live in
+    flat arrays so the memory budget holds however full the table is.
+    '''
+
+    def __init__(self, megabytes=16):
+        self.megabytes = megabytes
+        self.buckets = max(1, megabytes * 1024 * 1024 // (2 * ENTRY_BYTES))
+        size = 2 * self.buckets
+        self.keys = array('Q', bytes(8 * size))
+        self.values = array('i', bytes(4 * size))
+        self.depths = array('b', bytes(size))
+        self.flags = array('B', bytes(size))
+        self.ages = array('B', bytes(size))
+        self.moves = array('H', bytes(2 * size))  # Move.pack, 0 for none
+        self.age = 1
+
+    def new_search(self):
+        # results from older searches may be replaced even if deeper
+        self.age = self.age % 255 + 1
+
+    def clear(self):
+        self.__init__(self.megabytes)
+
+    def probe(self, key):
+        '''
+        Return (depth, value, flag, move) stored for key or None
+        '''
+        slot = key % self.buckets * 2
+        for i in (slot, slot + 1):
+            if self.keys[i] == key and self.ages[i]:
+                return self.depths[i], self.values[i], self.flags[i], self.moves[i] or None
+        return None
+
+    def store(self, key, depth, value, flag, move=None):
+        slot = key % self.buckets * 2
+        # depth-preferred slot: empty, same position, not shallower or stale
+        if (not self.ages[slot] or self.keys[slot] == key
+                or depth >= self.depths[slot] or self.ages[slot] != self.age):
+            i = slot
+        else:
+            i = slot + 1
+        if not move and self.keys[i] == key:
+            move = self.moves[i]
+        self.keys[i] = key
+        self.values[i] = value
+        self.depths[i] = max(-128, min(127, depth))
+        self.flags[i] = flag
+        self.ages[i] = self.age
+        self.moves[i] = move or 0
+
+    def hashfull(self):
+        '''
+        Permille of the first 1000 slots used by the current search
+        '''
+        sample = min(1000, len(self.ages))
+        return sum(1 for i in range(sample) if self.ages[i] == self.age) * 1000 // sample
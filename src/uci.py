@@ -0,0 +1,245 @@
+import argparse
+import sys
+import threading
+import time
+
+from board import START_FEN
+from bitboard import BACKENDS
+from engine import Engine, MATE
+from transposition import TranspositionTable
+from book import OpeningBook
+from tablebase import Tablebases
+from play import find_move
+
+# UCI front end. The main thread reads the commands, a search runs on its
+# own thread, so stop and ponderhit reach it while it thinks: Engine.stop
+# is looked at on every node. bestmove is written by the search thread,
+# after infinite and ponder searches only once stop or ponderhit came.
+
+NAME = 'ML_chess'
+AUTHOR = 'Ivan32232'
+MOVES_TO_GO = 30  # moves the clock is shared over when the GUI does not say
+
+
+class UCI:
+    '''
+    State of a UCI session: the position, the engine and the search thread
+    '''
+
+    def __init__(self, backend='bitboard', output=sys.stdout):
+        self.backend = backend
+        self.output = output
+        self.lock = threading.Lock()  # info lines and command answers do not interleave
+        self.engine = Engine(time_limit=None)  # go says how long
+        self.board = BACKENDS[backend].from_fen(START_FEN)
+        self.thread = None
+        self.released = threading.Event()  # set when an infinite or ponder search may answer
+        self.pending = None  # time limit a ponder search gets on ponderhit
+        self.overhead = 0.05  # seconds kept back per move for the GUI link
+        self.ponder = False
+
+    def send(self, text):
+        with self.lock:
+            self.output.write(text + '\n')
+            self.output.flush()
+
+    def run(self, lines):
+        '''
+        Handle command lines until quit or the end of input
+        '''
+        for line in lines:
+            if not self.command(line):
+                break
+        self.stop()
+
+    def command(self, line):
+        '''
+        Handle one command line, False on quit. Unknown commands are
+        ignored, as the protocol asks
+        '''
+        words = line.split()
+        if not words:
+            return True
+        name, args = words[0], words[1:]
+        if name == 'uci':
+            self.send(f'id name {NAME}')
+            self.send(f'id author {AUTHOR}')
+            self.send(f'option name Hash type spin default {self.engine.tt.megabytes} min 1 max 4096')
+            self.send('option name Ponder type check default false')
+            self.send(f'option name Move Overhead type spin default {int(self.overhead * 1000)} min 0 max 5000')
+            self.send('option name BookFile type string default <empty>')
+            self.send('option name TablebasePath type string default <empty>')
+            self.send('uciok')
+        elif name == 'isready':
+            self.send('readyok')
+        elif name == 'setoption':
+            self.stop()
+            self.set_option(args)
+        elif name == 'ucinewgame':
+            self.stop()
+            self.engine.tt = TranspositionTable(self.engine.tt.megabytes)
+            self.board = BACKENDS[self.backend].from_fen(START_FEN)
+        elif name == 'position':
+            self.stop()
+            self.set_position(args)
+        elif name == 'go':
+            self.stop()
+            self.go(args)
+        elif name == 'stop':
+            self.stop()
+        elif name == 'ponderhit':
+            self.ponderhit()
+        elif name == 'quit':
+            return False
+        return True
+
+    def set_option(self, args):
+        # setoption name <id> [value <x>], names may have spaces
+        text = ' '.join(args)
+        if not text.startswith('name '):
+            return
+        name, _, value = text[5:].partition(' value ')
+        name, value = name.strip().lower(), value.strip()
+        try:
+            if name == 'hash':
+                self.engine.tt = TranspositionTable(max(1, int(value)))
+            elif name == 'ponder':
+                self.ponder = value.lower() == 'true'
+            elif name == 'move overhead':
+                self.overhead = max(0, int(value)) / 1000
+            elif name == 'bookfile':
+                if self.engine.book is not None:
+                    self.engine.book.close()
+                self.engine.book = OpeningBook(value) if value and value != '<empty>' else None
+            elif name == 'tablebasepath':
+                if self.engine.tablebases is not None:
+                    self.engine.tablebases.close()
+                self.engine.tablebases = Tablebases(value) if value and value != '<empty>' else None
+        except (ValueError, OSError) as error:
+            self.send(f'info string setoption {name}: {error}')
+
+    def set_position(self, args):
+        # position startpos|fen <fen> [moves <move>...]
+        if 'moves' in args:
+            split = args.index('moves')
+            args, moves = args[:split], args[split + 1:]
+        else:
+            moves = []
+        try:
+            if args[:1] == ['startpos']:
+                board = BACKENDS[self.backend].from_fen(START_FEN)
+            elif args[:1] == ['fen']:
+                board = BACKENDS[self.backend].from_fen(' '.join(args[1:]))
+            else:
+                raise ValueError(f'bad position {" ".join(args)!r}')
+            for text in moves:
+                move = find_move(board, text)
+                if move is None:
+                    raise ValueError(f'illegal move {text}')
+                board.make_move(move)
+        except ValueError as error:
+            self.send(f'info string {error}')
+            return
+        self.board = board
+
+    def go(self, args):
+        options = {}
+        root_moves = None
+        i = 0
+        while i < len(args):
+            word = args[i]
+            if word in ('infinite', 'ponder'):
+                options[word] = True
+            elif word == 'searchmoves':
+                root_moves = set()
+                while i + 1 < len(args) and args[i + 1][0] in 'abcdefgh':
+                    i += 1
+                    root_moves.add(args[i])
+            elif i + 1 < len(args) and args[i + 1].lstrip('-').isdigit():
+                i += 1
+                options[word] = int(args[i])
+            i += 1
+
+        limit = self.time_limit(options)
+        infinite = 'infinite' in options or 'ponder' in options
+        # a ponder search thinks on the opponent's time, the clock starts at ponderhit
+        self.pending = limit if 'ponder' in options else None
+        if infinite:
+            self.released.clear()
+        else:
+            self.released.set()
+        self.thread = threading.Thread(
+            target=self._search,
+            args=(self.board, limit, options.get('depth'), options.get('nodes'), infinite, root_moves),
+            daemon=True,
+        )
+        self.thread.start()
+
+    def time_limit(self, options):
+        '''
+        Seconds to think from the go options, None without a clock
+        '''
+        if 'movetime' in options:
+            return max(0.001, options['movetime'] / 1000 - self.overhead)
+        clock = 'wtime' if self.board.next_player == 'white' else 'btime'
+        if clock not in options:
+            return None
+        left = options[clock] / 1000
+        increment = options.get('winc' if clock == 'wtime' else 'binc', 0) / 1000
+        share = left / (options.get('movestogo') or MOVES_TO_GO) + 0.8 * increment
+        return max(0.001, min(share, left / 2) - self.overhead)
+
+    def _search(self, board, limit, depth, nodes, infinite, root_moves):
+        result = self.engine.search(board, time_limit=limit, max_depth=depth, max_nodes=nodes,
+                                    infinite=infinite, on_info=self._info, root_moves=root_moves)
+        # infinite and ponder searches answer only when told to
+        self.released.wait()
+        if result.best_move is None:
+            self.send('bestmove 0000')
+        elif len(result.pv) > 1:
+            self.send(f'bestmove {result.best_move.uci()} ponder {result.pv[1].uci()}')
+        else:
+            self.send(f'bestmove {result.best_move.uci()}')
+
+    def _info(self, result):
+        if result.is_mate():
+            plies = MATE - abs(result.score)
+            score = f'mate {(plies + 1) // 2 if result.score > 0 else -(plies // 2)}'
+        else:
+            score = f'cp {result.score}'
+        pv = ' '.join(move.uci() for move in result.pv)
+        self.send(f'info depth {result.depth} score {score} nodes {result.nodes} nps {result.nps} '
+                  f'time {int(result.seconds * 1000)} hashfull {self.engine.tt.hashfull()} pv {pv}')
+
+    def ponderhit(self):
+        # the predicted move was played: keep searching, now on our own clock
+        if self.thread is None or not self.thread.is_alive():
+            return
+        if self.pending is not None:
+            self.engine.deadline = time.perf_counter() + self.pending
+        self.pending = None
+        self.released.set()
+
+    def stop(self):
+        # ask the search to unwind and wait for its bestmove
+        if self.thread is None:
+            return
+        self.released.set()
+        # a search that has not started yet would clear the flag, ask again
+        while self.thread.is_alive():
+            self.engine.stop()
+            self.thread.join(0.005)
+        self.thread = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='UCI engine over stdin/stdout')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='bitboard')
+    args = parser.parse_args(argv)
+
+    UCI(args.backend).run(sys.stdin)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
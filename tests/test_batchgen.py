@@ -0,0 +1,27 @@
+import random
+
+import numpy as np
+
+from bitboard import BACKENDS
+from batchgen import legal_move_masks
+from encoding import legal_mask
+from perft import POSITIONS
+from test_perft import EDGES
+
+
+def test_batch_masks_match_legal_mask():
+    # positions from seeded random games plus the perft edge cases, the
+    # whole lot as one batch
+    rng = random.Random(14)
+    boards = [BACKENDS['bitboard'].from_fen(fen) for fen, count in EDGES]
+    for fen, counts in POSITIONS.values():
+        board = BACKENDS['bitboard'].from_fen(fen)
+        for ply in range(40):
+            moves = board.legal_moves()
+            if not moves:
+                break
+            boards.append(BACKENDS['bitboard'].from_fen(board.to_fen()))
+            board.make_move(rng.choice(moves))
+    masks = legal_move_masks(boards)
+    for board, mask in zip(boards, masks):
+        assert np.array_equal(mask, legal_mask(board)), board.to_fen()
@@ -0,0 +1,60 @@
+import pytest
+
+from bitboard import BACKENDS
+
+
+@pytest.mark.parametrize('backend', sorted(BACKENDS))
+def test_checkers_and_attacked_by(backend):
+    board = BACKENDS[backend].from_fen('4k3/8/8/8/8/8/4r3/4K3 w - - 0 1')
+    assert board.checkers('white') == [(6, 4)]
+    assert board.attacked_by(6, 4, 'white') == [(7, 4)]
+    assert board.checkers('black') == []
+
+
+@pytest.mark.parametrize('backend', sorted(BACKENDS))
+@pytest.mark.parametrize('field', ['e', 'e0', 'i6', 'e3', 'd6', 'e66'])
+def test_from_fen_rejects_bad_en_passant(backend, field):
+    # white to move: only e6 has a black pawn that just moved past it
+    with pytest.raises(ValueError):
+        BACKENDS[backend].from_fen(f'4k3/8/8/4pP2/8/8/8/4K3 w - {field} 0 1')
+
+
+@pytest.mark.parametrize('backend', sorted(BACKENDS))
+def test_from_fen_en_passant(backend):
+    board = BACKENDS[backend].from_fen('4k3/8/8/4pP2/8/8/8/4K3 w - e6 0 1')
+    assert 'f5e6' in [move.uci() for move in board.legal_moves()]
+    assert board.to_fen() == '4k3/8/8/4pP2/8/8/8/4K3 w - e6 0 1'
+
+
+@pytest.mark.parametrize('backend', sorted(BACKENDS))
+def test_load_moves_without_duplicates(backend):
+    board = BACKENDS[backend].from_fen('4k3/8/1P6/8/8/8/1P6/4K3 w - - 0 1')
+    for row, col, expected in ((6, 1, ['b2b3', 'b2b4']), (2, 1, ['b6b7'])):
+        piece = board.squares[row][col].piece
+        board.load_moves(piece, row, col)
+        assert sorted(move.uci() for move in piece.moves) == expected
+
+
+@pytest.mark.parametrize('backend', sorted(BACKENDS))
+def test_game_over_check_fills_move_cache(backend, monkeypatch):
+    # the GUI's end of turn check generates the list once, the click reuses it
+    board = BACKENDS[backend].from_fen('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1')
+    calls = []
+    calc_moves = board.calc_moves
+    monkeypatch.setattr(board, 'calc_moves', lambda *args, **kwargs: calls.append(args) or calc_moves(*args, **kwargs))
+    assert not board.check_game_over('white', fill_cache=True)
+    assert len(calls) == len(board._piece_squares('white'))
+    calls.clear()
+    piece = board.squares[7][4].piece
+    board.load_moves(piece, 7, 4)
+    assert calls == []
+    assert sorted(move.uci() for move in piece.moves) == ['e1c1', 'e1d1', 'e1f1', 'e1g1']
+
+
+@pytest.mark.parametrize('backend', sorted(BACKENDS))
+def test_move_generation_leaves_pieces_alone(backend):
+    board = BACKENDS[backend].from_fen('r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1')
+    pieces = [square.piece for row in board.squares for square in row if square.piece]
+    assert board.has_legal_move('white')
+    assert board.legal_moves('black')
+    assert all(piece.moves == [] and piece.targets == 0 for piece in pieces)
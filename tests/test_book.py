@@ -0,0 +1,36 @@
+import pytest
+
+from bitboard import BACKENDS
+from board import START_FEN
+from book import encode_move
+from play import find_move
+
+# key examples of the Polyglot book format
+KEYS = [
+    ([], 0x463b96181691fc9c),
+    (['e2e4'], 0x823c9b50fd114196),
+    (['e2e4', 'd7d5'], 0x0756b94461c50fb0),
+    (['e2e4', 'd7d5', 'e4e5'], 0x662fafb965db29d4),
+    (['e2e4', 'd7d5', 'e4e5', 'f7f5'], 0x22a48b5a8e47ff78),
+    (['e2e4', 'd7d5', 'e4e5', 'f7f5', 'e1e2'], 0x652a607ca3f242c1),
+    (['e2e4', 'd7d5', 'e4e5', 'f7f5', 'e1e2', 'e8f7'], 0x00fdd303c946bdd9),
+    (['a2a4', 'b7b5', 'h2h4', 'b5b4', 'c2c4'], 0x3c8123ea7b067637),
+    (['a2a4', 'b7b5', 'h2h4', 'b5b4', 'c2c4', 'b4c3', 'a1a3'], 0x5c3f9b829b279560),
+]
+
+
+@pytest.mark.parametrize('backend', sorted(BACKENDS))
+@pytest.mark.parametrize('moves, key', KEYS)
+def test_polyglot_keys(backend, moves, key):
+    board = BACKENDS[backend].from_fen(START_FEN)
+    for text in moves:
+        board.make_move(find_move(board, text))
+    assert board.hash == key
+    assert BACKENDS[backend].from_fen(board.to_fen()).hash == key
+
+
+def test_castling_is_encoded_as_king_takes_rook():
+    board = BACKENDS['bitboard'].from_fen('r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1')
+    # e1h1: to file 7, to rank 0, from file 4, from rank 0
+    assert encode_move(board, find_move(board, 'e1g1')) == 7 | 4 << 6
+    assert encode_move(board, find_move(board, 'e1c1')) == 0 | 4 << 6
@@ -0,0 +1,49 @@
+import random
+
+import pytest
+
+from bitboard import BACKENDS
+from perft import POSITIONS
+
+
+def state(board):
+    '''
+    Everything make/unmake keeps up to date instead of rebuilding
+    '''
+    fields = {
+        'hash': board.hash,
+        'eval': (board.mg_score, board.eg_score, board.phase),
+        'castling': board.castling,
+        'kings': dict(board.kings),
+        'codes': bytes(board.codes),
+        'pack': board.pack(),
+        'checkers': sorted(board.checkers(board.next_player)),
+    }
+    if board.track_attacks:
+        fields['attackers'] = {color: [sorted(squares) for squares in board.attackers[color]]
+                               for color in ('white', 'black')}
+    if hasattr(board, 'pieces'):
+        fields['bitboards'] = (board.pieces, board.occupied)
+    return fields
+
+
+@pytest.mark.parametrize('backend', sorted(BACKENDS))
+@pytest.mark.parametrize('name', ['start', 'kiwipete', 'position4', 'position5'])
+def test_incremental_state_matches_from_fen(backend, name):
+    # random games: after every move the board must look like one set up
+    # from its FEN, and unmaking every move must bring the start back
+    board_class = BACKENDS[backend]
+    rng = random.Random(name)
+    for game in range(4):
+        board = board_class.from_fen(POSITIONS[name][0])
+        start = state(board)
+        tokens = []
+        for ply in range(60):
+            moves = board.legal_moves()
+            if not moves:
+                break
+            tokens.append(board.make_move(rng.choice(moves)))
+            assert state(board) == state(board_class.from_fen(board.to_fen()))
+        while tokens:
+            board.unmake_move(tokens.pop())
+        assert state(board) == start
@@ -0,0 +1,44 @@
+import pytest
+
+from bitboard import BACKENDS
+from perft import POSITIONS, perft
+
+# (position, depth) of the reference counts in perft.POSITIONS
+STANDARD = [('start', 3), ('kiwipete', 3), ('position3', 4), ('position4', 3), ('position5', 3)]
+
+# en passant, castling, promotion and pin edge cases, depth 3 counts of
+# the legality test that played every move and looked for a check
+EDGES = [
+    ('3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1', 1670),
+    ('8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1', 1266),
+    ('8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1', 1928),
+    ('5k2/8/8/8/8/8/8/4K2R w K - 0 1', 1198),
+    ('3k4/8/8/8/8/8/8/R3K3 w Q - 0 1', 1286),
+    ('r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1', 27826),
+    ('r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1', 50509),
+    ('2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1', 1442),
+    ('8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1', 5160),
+    ('4k3/1P6/8/8/8/8/K7/8 w - - 0 1', 472),
+    ('8/P1k5/K7/8/8/8/8/8 w - - 0 1', 273),
+    ('K1k5/8/P7/8/8/8/8/8 w - - 0 1', 13),
+    ('8/k1P5/8/1K6/8/8/8/8 w - - 0 1', 268),
+    ('8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1', 6559),
+    ('8/8/8/8/k2Pp2Q/8/8/3K4 b - d3 0 1', 863),
+    ('8/8/8/2k5/3Pp3/8/8/4K3 b - d3 0 1', 379),
+    ('4k3/8/8/8/1b1pP3/8/8/4K3 b - e3 0 1', 1003),
+    ('rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 1', 21637),
+    ('8/8/8/1k6/3Pp3/8/8/4KQ2 b - d3 0 1', 711),
+]
+
+
+@pytest.mark.parametrize('backend', sorted(BACKENDS))
+@pytest.mark.parametrize('name, depth', STANDARD)
+def test_perft_reference(backend, name, depth):
+    fen, counts = POSITIONS[name]
+    assert perft(BACKENDS[backend].from_fen(fen), depth) == counts[depth - 1]
+
+
+@pytest.mark.parametrize('backend', sorted(BACKENDS))
+@pytest.mark.parametrize('fen, count', EDGES)
+def test_perft_edges(backend, fen, count):
+    assert perft(BACKENDS[backend].from_fen(fen), 3) == count
@@ -0,0 +1,9 @@
+import pytest
+
+import tbgen
+
+
+def test_missing_promotion_table_is_named(tmp_path):
+    with pytest.raises(FileNotFoundError, match='KQK'):
+        tbgen.generate('KPK', tmp_path, workers=1)
+    assert list(tmp_path.iterdir()) == []
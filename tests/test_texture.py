@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+pygame = pytest.importorskip('pygame')
+
+from const import WIDTH, HIGHT, SQSIZE
+from game import Game
+from texture import TextureCache
+
+
+@pytest.fixture
+def screen(monkeypatch):
+    monkeypatch.setenv('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    yield pygame.display.set_mode((WIDTH, HIGHT))
+    pygame.quit()
+
+
+def test_missing_images_are_drawn_as_letters(screen, tmp_path):
+    textures = TextureCache(directory=os.fspath(tmp_path))
+    assert textures.get('black', 'knight', size=128).get_size() == (128, 128)
+
+    game = Game(textures=textures)
+    game.show_pieces(screen)
+    assert game.show_square(screen, 7, 4) == pygame.Rect(4 * SQSIZE, 7 * SQSIZE, SQSIZE, SQSIZE)
+    dragger = game.dragger
+    dragger.update_mouse((100, 100))
+    dragger.drag_piece(game.board.squares[6][0].piece)
+    assert dragger.rect().center == (100, 100)
+    dragger.update_blit(screen)
+    game.board.promotion_pending = {'color': 'white'}
+    game.show_promotion_menu(screen)